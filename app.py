@@ -1,17 +1,20 @@
 import os
+import io
 import base64
 import json
 import re
 import time
 import random
 import logging
+import hashlib
 import threading
-from queue import Queue
-from datetime import datetime
-# Parallel executor removed (sequential processing only now)
-from flask import Flask, render_template, request, redirect, url_for, session, flash, get_flashed_messages, jsonify, Response, stream_with_context
-from werkzeug.utils import secure_filename
-from typing import Optional, Dict, Any, List, Tuple, Callable
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import chain
+from queue import Queue, SimpleQueue, Full, Empty
+from concurrent.futures import ThreadPoolExecutor, Future
+from flask import Flask, render_template, request, redirect, url_for, session, flash, get_flashed_messages, jsonify, Response, stream_with_context, g
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable, Iterator, FrozenSet, BinaryIO, Deque
 
 # Load .env for local development only
 try:
@@ -21,28 +24,121 @@ except Exception:
     pass
 
 import azure_openai_client
-from chunking import chunk_text_by_tokens
-from langdetect import detect, DetectorFactory
-from i18n import get_strings
+from chunking import chunk_text_by_tokens, get_encoding
+from i18n import get_strings, SUPPORTED_LANGS as _VALID_UI_LANGS
+try:
+    import orjson  # optional: C JSON encoder for log/metric lines
+except Exception:
+    orjson = None  # type: ignore
+
+try:
+    import fasttext  # optional: compiled language identification
+except Exception:
+    fasttext = None  # type: ignore
+
+try:
+    from langdetect import DetectorFactory
+    from langdetect.detector_factory import PROFILES_DIRECTORY
+except Exception:
+    DetectorFactory = None  # type: ignore
+
 try:
     from docx import Document  # python-docx
 except Exception:
     Document = None  # type: ignore
 
+try:
+    import pypdfium2 as pdfium  # PDFium (C++) text extraction, preferred when available
+except Exception:
+    pdfium = None  # type: ignore
+
 try:
     from PyPDF2 import PdfReader
 except Exception:
     PdfReader = None  # type: ignore
 
-
-
-DetectorFactory.seed = 0  # make langdetect deterministic
-
 # Basic logging setup (idempotent)
 logger = logging.getLogger("text_assistant")
 if not logger.handlers:
     logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
 
+# Language identification: prefer a FastText LID model (single C++ forward pass) when the
+# package and model file are present; otherwise fall back to langdetect.
+FASTTEXT_LID_MODEL_PATH = os.getenv('FASTTEXT_LID_MODEL', os.path.join(os.getcwd(), 'lid.176.bin'))
+_lid_model = None
+if fasttext is not None and os.path.isfile(FASTTEXT_LID_MODEL_PATH):
+    try:
+        _lid_model = fasttext.load_model(FASTTEXT_LID_MODEL_PATH)
+        logger.info("FastText language identification model loaded")
+    except Exception as e:
+        logger.warning(f"Failed to load FastText model, using langdetect: {e}")
+
+# Process-wide langdetect factory: profiles are loaded once at import, each call
+# only creates a lightweight Detector bound to them. Only a curated subset of the 55
+# bundled profiles is loaded (tens of MB less RSS per worker); 'all' loads every profile.
+LANGDETECT_LANGUAGES = os.getenv('LANGDETECT_LANGUAGES', 'en,de,fr,es,it,pt,nl,ru,ja,zh-cn,ar,tr,pl,cs')
+
+
+def _load_langdetect_profiles(factory: Any) -> None:
+    wanted = sorted({l.strip().lower() for l in LANGDETECT_LANGUAGES.split(',') if l.strip()})
+    profiles = []
+    if wanted != ['all']:
+        for lang in wanted:
+            profile_path = os.path.join(PROFILES_DIRECTORY, lang)
+            if os.path.isfile(profile_path):
+                with open(profile_path, 'r', encoding='utf-8') as f:
+                    profiles.append(f.read())
+    if len(profiles) >= 2:  # langdetect needs at least two profiles to discriminate
+        factory.load_json_profile(profiles)
+    else:
+        factory.load_profile(PROFILES_DIRECTORY)
+
+
+_lang_factory = None
+if DetectorFactory is not None:
+    _lang_factory = DetectorFactory()
+    _load_langdetect_profiles(_lang_factory)
+    _lang_factory.set_seed(0)  # make langdetect deterministic
+
+
+# Language ID saturates after a few hundred characters; only a prefix is scored.
+LANG_DETECT_MAX_CHARS = int(os.getenv('LANG_DETECT_MAX_CHARS', '2048'))
+
+
+# Resubmissions of the same text are common; detected languages are memoised by a digest of
+# the scored prefix (the text itself is never retained).
+_LANG_CACHE_MAX = 512
+_lang_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_lang_cache_lock = threading.Lock()
+
+
+def _detect_language(text: str) -> str:
+    sample = text[:LANG_DETECT_MAX_CHARS]
+    key = hashlib.blake2b(sample.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _lang_cache_lock:
+        lang = _lang_cache.get(key)
+        if lang is not None:
+            _lang_cache.move_to_end(key)
+            return lang
+    lang = _detect_language_uncached(sample)
+    with _lang_cache_lock:
+        _lang_cache[key] = lang
+        if len(_lang_cache) > _LANG_CACHE_MAX:
+            _lang_cache.popitem(last=False)
+    return lang
+
+
+def _detect_language_uncached(text: str) -> str:
+    if _lid_model is not None:
+        # fastText predicts per line; newlines must be flattened
+        labels, _ = _lid_model.predict(text.replace('\n', ' '), k=1)
+        return labels[0].replace('__label__', '')
+    if _lang_factory is None:
+        raise RuntimeError('No language detection backend installed')
+    detector = _lang_factory.create()
+    detector.append(text)
+    return detector.detect()
+
 # Optional Application Insights / OpenTelemetry
 APPINSIGHTS_CONNECTION_STRING = os.getenv('APPLICATIONINSIGHTS_CONNECTION_STRING')
 if APPINSIGHTS_CONNECTION_STRING:
@@ -53,27 +149,205 @@ if APPINSIGHTS_CONNECTION_STRING:
     except Exception as e:
         logger.warning(f"Failed to configure Application Insights: {e}")
 
+# Most recent submissions kept in each user's history, and how many users' histories are retained
+SESSION_HISTORY_MAX = 20
+HISTORY_MAX_USERS = 1000
+# Background job registry: shard count (power of two) and retention of finished/abandoned jobs
+_JOB_SHARD_COUNT = 16
+JOB_SWEEP_INTERVAL_SECS = 60
+# Idle SSE connections get a ping this often so proxies don't drop them
+SSE_HEARTBEAT_SECS = float(os.getenv('SSE_HEARTBEAT_SECS', '15'))
+
+
+@dataclass
+class ChunkCounters:
+    """Running per-job chunk tallies.
+
+    Attempts and usage are recorded by the chunk worker threads as calls finish; completed and
+    failed are only counted as the in-order loop consumes each result, so prefetched chunks
+    the job never emitted are not reported.
+    """
+    completed: int = 0
+    failed: int = 0
+    retried: int = 0
+    # Token usage summed over every successful chunk call (prompt/completion/total tokens)
+    usage: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    # Set once the job is finalised; calls that finish later are left out of the totals
+    closed: bool = False
+
+    def add_usage(self, usage: Optional[Dict[str, int]]) -> None:
+        if usage:
+            with self.lock:
+                if not self.closed:
+                    self.usage.update(usage)
+
+    def record_call(self, attempts: int, usage: Optional[Dict[str, int]] = None) -> None:
+        self.add_usage(usage)
+        if attempts > 1:
+            with self.lock:
+                if not self.closed:
+                    self.retried += 1
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+
+    def record_result(self, success: bool) -> None:
+        with self.lock:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+class ChunkAborted(Exception):
+    """Raised in a chunk worker whose job was aborted before (or while) the chunk ran."""
+
+
 METRICS_FILE_PATH = os.getenv('METRICS_FILE_PATH', os.path.join(os.getcwd(), 'metrics.log'))
-METRICS_FILE_LOCK = threading.Lock()
+# Metric records are handed to a single background writer that keeps the file open, so
+# request and chunk threads never contend on a lock or pay open/write/close per event.
+_metric_queue: "Queue[Tuple[float, dict]]" = Queue(maxsize=10_000)
+_metric_writer_thread: Optional[threading.Thread] = None
+_metric_writer_lock = threading.Lock()
+
+def _json_bytes(obj: Any) -> bytes:
+    """Serialise obj to compact UTF-8 JSON, via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _metric_writer() -> None:
+    f = None
+    while True:
+        t_epoch, record = _metric_queue.get()
+        try:
+            # Timestamps are captured by the caller but formatted here, off the request path
+            record.setdefault('timestamp', _utc_timestamp(t_epoch))
+            if f is None:
+                f = open(METRICS_FILE_PATH, 'ab')
+            f.write(_json_bytes(record) + b'\n')
+            if _metric_queue.empty():
+                f.flush()
+        except Exception:
+            logger.debug("Failed to persist metric", exc_info=True)
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+                f = None  # reopen on next record
 
 def _persist_metric(record: dict):
-    """Append a JSON line to metrics log file (best-effort)."""
+    """Queue a JSON line for the metrics log file (best-effort, never blocks)."""
+    global _metric_writer_thread
+    if _metric_writer_thread is None or not _metric_writer_thread.is_alive():
+        # Started lazily so forked workers (e.g. gunicorn --preload) get their own writer
+        with _metric_writer_lock:
+            if _metric_writer_thread is None or not _metric_writer_thread.is_alive():
+                _metric_writer_thread = threading.Thread(target=_metric_writer, name='metrics-writer', daemon=True)
+                _metric_writer_thread.start()
     try:
-        line = json.dumps(record, ensure_ascii=False)
-        with METRICS_FILE_LOCK:
-            with open(METRICS_FILE_PATH, 'a', encoding='utf-8') as f:
-                f.write(line + '\n')
-    except Exception:
-        logger.debug("Failed to persist metric", exc_info=True)
+        _metric_queue.put_nowait((time.time(), record))
+    except Full:
+        logger.debug("Metric queue full; dropping record")
 
 def _log_json(event: str, **fields: Any) -> None:
+    # Skip building/serialising the payload entirely when INFO records would be dropped
+    if not logger.isEnabledFor(logging.INFO):
+        return
     try:
         payload = {"event": event, **fields}
-        logger.info(json.dumps(payload))
+        logger.info(_json_bytes(payload).decode('utf-8'))
     except Exception:
         logger.debug("Failed to log json payload", exc_info=True)
 
-def should_retry(exc: Exception, retryable_status_codes: List[int]) -> bool:
+def _utc_timestamp(t: Optional[float] = None) -> str:
+    """ISO-8601 UTC timestamp (microsecond precision) without building a datetime object."""
+    if t is None:
+        t = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + f'.{int(t % 1 * 1_000_000):06d}Z'
+
+def _preview(text: str, limit: int = 500) -> str:
+    """Return text truncated to `limit` characters with an ellipsis when cut."""
+    return text if len(text) <= limit else text[:limit] + '…'
+
+def _pdf_page_text(page: Any) -> str:
+    """Extract a PDF page's text; unreadable pages contribute an empty string."""
+    try:
+        return page.extract_text() or ''
+    except Exception:
+        return ''
+
+# PDF text extraction fans page ranges out over a few threads for large documents
+PDF_EXTRACT_WORKERS = max(1, int(os.getenv('PDF_EXTRACT_WORKERS', str(min(8, os.cpu_count() or 4)))))
+_PDF_MIN_PAGES_PER_WORKER = 8
+
+# PDFium is one native library instance per process and is not thread-safe: every
+# document open/read/close goes through this lock, whichever request thread asks
+_PDFIUM_LOCK = threading.Lock()
+
+def _pdfium_page_text(page: Any, index: int) -> str:
+    """Extract a PDFium page's text; a page that fails is logged and contributes an empty string."""
+    try:
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range().replace('\r\n', '\n')
+        finally:
+            textpage.close()
+    except Exception as e:
+        logger.warning(f"PDF page {index} text extraction failed: {e}")
+        return ''
+    finally:
+        page.close()
+
+def _iter_pdf_pages(data: bytes) -> Iterator[str]:
+    """Yield the text of each PDF page in order.
+
+    Uses PDFium when installed (pages are read under _PDFIUM_LOCK and yielded only after the
+    lock is released); otherwise PyPDF2, parallelised over page ranges for large documents
+    (one fragment per range).
+    """
+    if pdfium is not None:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(data)
+            try:
+                texts = [_pdfium_page_text(page, i) for i, page in enumerate(pdf)]
+            finally:
+                pdf.close()
+        yield from texts
+        return
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    workers = min(PDF_EXTRACT_WORKERS, page_count // _PDF_MIN_PAGES_PER_WORKER)
+    if workers <= 1:
+        for p in reader.pages:
+            yield _pdf_page_text(p)
+        return
+
+    def _extract_range(bounds: Tuple[int, int]) -> str:
+        # A PdfReader seeks on one shared stream and is not thread-safe, so each worker
+        # parses its own reader over the same in-memory bytes.
+        local_reader = PdfReader(io.BytesIO(data))
+        return "\n".join(_pdf_page_text(local_reader.pages[i]) for i in range(*bounds))
+
+    step = -(-page_count // workers)  # ceil division
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        yield from executor.map(_extract_range, ranges)
+
+def _iter_docx_paragraphs(stream: BinaryIO) -> Iterator[str]:
+    """Yield the text of each DOCX paragraph in order, reading the upload stream directly."""
+    for p in Document(stream).paragraphs:
+        yield p.text
+
+# Message fragments that signal throttling when no status code is attached to the exception
+_RETRY_MESSAGE_RE = re.compile(r'rate limit|too many requests|retry later', re.IGNORECASE)
+
+
+def should_retry(exc: Exception, retryable_status_codes: FrozenSet[int]) -> bool:
     """Return True if this exception is retryable based on status codes or type.
 
     We inspect common attributes (status_code, status) and message text for 429/rate limiting.
@@ -90,10 +364,31 @@ def should_retry(exc: Exception, retryable_status_codes: List[int]) -> bool:
         if status >= 500:
             return True
     # Text heuristics (fallback)
-    msg = str(exc).lower()
-    if any(tok in msg for tok in ["rate limit", "too many requests", "retry later"]):
-        return True
-    return False
+    return _RETRY_MESSAGE_RE.search(str(exc)) is not None
+
+
+# System prompts are built once at import; the translation template only fills in languages.
+# Strong instruction: only raw translated text, no labels, no commentary, NO SUMMARIZATION
+TRANSLATE_SYSTEM_PROMPT_TEMPLATE = (
+    "You are a professional translator. Translate the user's text from the detected source "
+    "language ({source_lang}) to the target language ({target_lang}). Preserve tone, style, meaning, register, factual detail, sentence boundaries, paragraph structure, lists, numbering, and line breaks/formatting EXACTLY. "
+    "Do NOT summarize, shorten, condense, omit, merge, reorder, or add content. Every sentence, bullet, number, code block, heading, line break, and paragraph present in the input MUST appear (appropriately translated) in the output. If something is already a proper name or should remain untranslated, keep it as-is. "
+    "Return ONLY the translated text itself. Do NOT prepend labels, explanations, apologies, summaries, code fences, markdown headers, quotes, or phrases like 'Translation:', 'Here is the translation', or similar. Output strictly the final translated text. "
+    "If the input is already entirely in the target language, simply reproduce it verbatim (no changes) unless there are obvious orthographic errors."
+)
+
+GRAMMAR_SYSTEM_PROMPT = (
+    "You are an expert copy editor. Improve grammar, spelling, punctuation, clarity, and style while preserving meaning, tone, voice, emphasis, formatting, sentence order, paragraph structure, lists, numbering, headings, code blocks, and line breaks EXACTLY. "
+    "ABSOLUTELY DO NOT summarize, shorten, condense, omit, merge, or reorder content. Do not remove redundancy unless it is a clear grammatical error; err on the side of preserving all words. If a sentence is already correct, leave it unchanged. "
+    "Return ONLY the fully corrected text itself with no added labels, no introductory phrases, no explanations, no commentary, no code fences, and no quotes. Do NOT output phrases like 'Corrected text:', 'Here is', or similar. "
+    "If the language is German then apply these rules: "
+    "1. Zeitform (Präteritum / Präsens): Erzählung meist im Präteritum, direkte Rede im Präsens. "
+    "2. Anführungszeichen: Deutsch: „…“ (Duden-Norm). "
+    "3. Gedankenstriche: Deutsch: Halbgeviertstrich (–) mit Leerzeichen. "
+    "4. Absätze / Einrückungen: Einheitlich (Einrückung oder Leerzeile). "
+    "5. Lesbarkeit: Einheitliche Typografie, keine Übersetzungsreste. Typografieregeln folgen der Zielsprache. "
+    "Output ONLY the fully corrected text, nothing else."
+)
 
 
 def create_app():
@@ -102,13 +397,67 @@ def create_app():
     # Secret key for sessions (required). Use a strong random value in production.
     app.secret_key = os.getenv("FLASK_SECRET_KEY", os.urandom(24))
 
+    # Optional server-side sessions: with REDIS_URL set, the cookie only carries a session id.
+    redis_url = os.getenv('REDIS_URL')
+    if redis_url:
+        try:
+            import redis  # type: ignore
+            from flask_session import Session  # type: ignore
+            app.config.update(SESSION_TYPE='redis', SESSION_REDIS=redis.Redis.from_url(redis_url))
+            Session(app)
+            logger.info("Server-side Redis sessions enabled")
+        except Exception as e:
+            logger.warning(f"Failed to enable Redis sessions, using signed cookies: {e}")
+
     # Upload configuration (text files only)
     app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB upload cap
-    app.config['UPLOAD_EXTENSIONS'] = ['.txt', '.md', '.docx', '.pdf']
-    app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    app.config['UPLOAD_EXTENSIONS'] = frozenset({'.txt', '.md', '.docx', '.pdf'})
+
+    # Runtime settings are read from the environment once at startup, not per request
+    app.config.update(
+        AZURE_OPENAI_DEPLOYMENT=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
+        AOAI_TEMPERATURE=float(os.getenv('AOAI_TEMPERATURE', '0.2')),
+        MAX_OUTPUT_TOKENS=int(os.getenv('MAX_OUTPUT_TOKENS', '2048')),
+        MAX_INPUT_TOKENS=int(os.getenv('MAX_INPUT_TOKENS', '12000')),
+        TIKTOKEN_ENCODING=os.getenv('TIKTOKEN_ENCODING', 'o200k_base'),
+        DISABLE_AUTH=os.getenv('DISABLE_AUTH', 'false').lower() == 'true',
+        ALLOWED_EMAILS=frozenset(e.strip().lower() for e in os.getenv('ALLOWED_EMAILS', '').split(',') if e.strip()),
+        DEBUG_METRICS=os.getenv('DEBUG_METRICS', 'false').lower() == 'true',
+        UI_LANG=os.getenv('UI_LANG', 'en'),
+        MAX_PARALLEL_REQUESTS=max(1, int(os.getenv('MAX_PARALLEL_REQUESTS', '4'))),
+        CHUNK_POOL_SIZE=max(2, int(os.getenv('CHUNK_POOL_SIZE') or 2 * int(os.getenv('MAX_PARALLEL_REQUESTS', '4')))),
+        RETRY_MAX_ATTEMPTS=max(1, int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))),
+        RETRY_BASE_DELAY_SECS=float(os.getenv('RETRY_BASE_DELAY_SECS', '1.0')),
+        RETRY_BACKOFF_FACTOR=float(os.getenv('RETRY_BACKOFF_FACTOR', '2.0')),
+        RETRY_JITTER_SECS=float(os.getenv('RETRY_JITTER_SECS', '0.25')),
+        RETRY_STATUS_CODES=frozenset(int(c.strip()) for c in os.getenv('RETRY_STATUS_CODES', '429,500,502,503,504').split(',') if c.strip().isdigit()),
+        CIRCUIT_BREAKER_FAILURE_THRESHOLD=int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '3')),
+        LONG_CHUNK_THRESHOLD_SECS=float(os.getenv('LONG_CHUNK_THRESHOLD_SECS', '30')),
+        # Opt-in Azure OpenAI Batch API for large async jobs (needs a Global Batch deployment)
+        AOAI_BATCH_ENABLED=os.getenv('AOAI_BATCH_ENABLED', 'false').lower() == 'true',
+        AOAI_BATCH_DEPLOYMENT=os.getenv('AOAI_BATCH_DEPLOYMENT') or os.getenv('AZURE_OPENAI_DEPLOYMENT'),
+        AOAI_BATCH_MIN_CHUNKS=int(os.getenv('AOAI_BATCH_MIN_CHUNKS', '16')),
+        AOAI_BATCH_POLL_SECS=float(os.getenv('AOAI_BATCH_POLL_SECS', '30')),
+        AOAI_BATCH_TIMEOUT_SECS=float(os.getenv('AOAI_BATCH_TIMEOUT_SECS', '86400')),
+        JOB_TTL_SECS=float(os.getenv('JOB_TTL_SECS', '3600')),
+    )
+
+    # One long-lived pool for chunk model calls, shared by all jobs (threads start lazily).
+    # Its size caps concurrent Azure OpenAI calls per worker process; a single job may hold at
+    # most half of it, so one large document cannot make every other job queue behind it.
+    chunk_pool_size = app.config['CHUNK_POOL_SIZE']
+    chunk_executor = ThreadPoolExecutor(max_workers=chunk_pool_size, thread_name_prefix='chunk')
+
+    # Resolve the tokenizer once at startup so requests never pay the BPE load
+    encoding = get_encoding(app.config['TIKTOKEN_ENCODING'])
 
     def get_authenticated_user() -> Optional[Dict[str, Any]]:
+        # Parsed at most once per request; later calls reuse the result stored on flask.g
+        if '_authenticated_user' not in g:
+            g._authenticated_user = _parse_client_principal()
+        return g._authenticated_user
+
+    def _parse_client_principal() -> Optional[Dict[str, Any]]:
         principal_b64 = request.headers.get('X-MS-CLIENT-PRINCIPAL')
         if principal_b64:
             try:
@@ -136,9 +485,9 @@ def create_app():
         the ALLOWED_EMAILS app setting (comma-separated). If ALLOWED_EMAILS is empty,
         all authenticated users are allowed. When DISABLE_AUTH=true, always allow.
         """
-        if os.getenv('DISABLE_AUTH', 'false').lower() == 'true':
+        if app.config['DISABLE_AUTH']:
             return True
-        allowed = [e.strip().lower() for e in os.getenv('ALLOWED_EMAILS', '').split(',') if e.strip()]
+        allowed = app.config['ALLOWED_EMAILS']
         if not allowed:
             return True  # no restriction
         if not user:
@@ -152,8 +501,8 @@ def create_app():
         user = get_authenticated_user()
         if not is_email_allowed(user):
             # If running locally without Easy Auth, permit bypass with DISABLE_AUTH=true
-            return render_template('access_denied.html', disable_auth=(os.getenv('DISABLE_AUTH', 'false').lower() == 'true')), 403
-        lang = session.get('ui_lang', os.getenv('UI_LANG', 'en'))
+            return render_template('access_denied.html', disable_auth=app.config['DISABLE_AUTH']), 403
+        lang = session.get('ui_lang', app.config['UI_LANG'])
         strings = get_strings(lang)
         return render_template('index.html',
                                user=user,
@@ -161,18 +510,99 @@ def create_app():
                                source_lang=None,
                                target_lang=None,
                                mode=session.get('mode', 'grammar'),  # default to grammar
-                               history=session.get('history', []),
+                               history=_get_history(user),
                                strings=strings,
                                ui_lang=lang)
 
     # Handle submission for grammar check or translation
-    # In-memory store for background jobs (simple, per-process only)
-    jobs: Dict[str, Dict[str, Any]] = {}
-    jobs_lock = threading.Lock()
+    # In-memory store for background jobs (simple, per-process only). Striped across
+    # independently locked shards so concurrent jobs and SSE polls don't contend on one mutex.
+    job_shards: List[Tuple[Dict[str, Dict[str, Any]], threading.Lock]] = [({}, threading.Lock()) for _ in range(_JOB_SHARD_COUNT)]
+
+    def _job_shard(job_id: str) -> Tuple[Dict[str, Dict[str, Any]], threading.Lock]:
+        return job_shards[hash(job_id) & (_JOB_SHARD_COUNT - 1)]
+
+    def _evict_expired_jobs() -> None:
+        """Drop finished jobs older than JOB_TTL_SECS, waking any SSE stream still reading them."""
+        while True:
+            time.sleep(JOB_SWEEP_INTERVAL_SECS)
+            cutoff = time.time() - app.config['JOB_TTL_SECS']
+            for shard, shard_lock in job_shards:
+                with shard_lock:
+                    # Jobs still running (e.g. waiting on a Batch API run) are kept until they finish
+                    expired = [jid for jid, job in shard.items()
+                               if job.get('created_epoch', 0) < cutoff and job.get('status') not in ('pending', 'running')]
+                    evicted = [shard.pop(jid) for jid in expired]
+                for job in evicted:
+                    q: SimpleQueue = job.get('queue')  # type: ignore
+                    if q is None:
+                        continue
+                    while True:
+                        try:
+                            q.get_nowait()
+                        except Empty:
+                            break
+                    q.put_nowait(None)  # sentinel: stream sees the job gone and ends
+                if evicted:
+                    _log_json('jobs_evicted', count=len(evicted))
+
+    threading.Thread(target=_evict_expired_jobs, name='job-evictor', daemon=True).start()
+
+    # Pay client construction, the first token fetch and the TLS handshake at boot rather than on
+    # the first user's request; runs in the background so startup is not blocked
+    def _prewarm_client() -> None:
+        t0 = time.perf_counter()
+        try:
+            azure_openai_client.prewarm()
+            _log_json('aoai_prewarm', ms=round((time.perf_counter() - t0) * 1000, 1))
+        except Exception as e:
+            logger.warning(f"Azure OpenAI pre-warm failed (first request will initialise): {e}")
+
+    if os.getenv('AZURE_OPENAI_ENDPOINT') and os.getenv('AOAI_PREWARM', 'true').lower() == 'true':
+        threading.Thread(target=_prewarm_client, name='aoai-prewarm', daemon=True).start()
 
     def _create_job_id() -> str:
         return base64.urlsafe_b64encode(os.urandom(9)).decode('utf-8').rstrip('=')
 
+    # Submission history is kept server-side (bounded per user, least recently used users
+    # dropped first) so it never inflates the session cookie that is signed on every response.
+    history_store: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+    history_lock = threading.Lock()
+
+    def _history_key(user: Optional[Dict[str, Any]], create: bool = False) -> Optional[str]:
+        if user and user.get('id'):
+            return f"user:{user['id']}"
+        if user and user.get('email'):
+            return f"email:{user['email']}"
+        # Anonymous (DISABLE_AUTH) visitors get a random id pinned in their session, created only
+        # when history is first written so plain page views leave the session untouched
+        history_id = session.get('history_id')
+        if not history_id:
+            if not create:
+                return None
+            history_id = session['history_id'] = _create_job_id()
+        return f"session:{history_id}"
+
+    def _get_history(user: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        key = _history_key(user)
+        if key is None:
+            return []
+        with history_lock:
+            entries = history_store.get(key)
+            return list(entries) if entries else []
+
+    def _append_history(user: Optional[Dict[str, Any]], entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        key = _history_key(user, create=True)
+        with history_lock:
+            entries = history_store.pop(key, None)
+            if entries is None:
+                entries = deque(maxlen=SESSION_HISTORY_MAX)
+            entries.append(entry)
+            history_store[key] = entries  # re-insert as most recently used
+            while len(history_store) > HISTORY_MAX_USERS:
+                history_store.popitem(last=False)
+            return list(entries)
+
     @app.route('/process', methods=['POST'])
     def process():
         # Start async job then redirect to index which will poll
@@ -180,8 +610,9 @@ def create_app():
 
     @app.get('/job/<job_id>/status')
     def job_status(job_id: str):
-        with jobs_lock:
-            job = jobs.get(job_id)
+        shard, shard_lock = _job_shard(job_id)
+        with shard_lock:
+            job = shard.get(job_id)
         if not job:
             return jsonify({'error': 'not_found'}), 404
         # Exclude non-serializable / internal fields
@@ -190,33 +621,39 @@ def create_app():
     @app.get('/job/<job_id>/stream')
     def job_stream(job_id: str):
         """Server-Sent Events stream for job progress."""
+        shard, shard_lock = _job_shard(job_id)
+
         def event_gen():
+            with shard_lock:
+                job = shard.get(job_id)
+            if not job:
+                yield 'event: error\ndata: {"error":"not_found"}\n\n'
+                return
+            # The queue is fixed for the job's lifetime, so block on it directly
+            q: SimpleQueue = job.get('queue')  # type: ignore
+            if q is None:
+                yield 'event: error\ndata: {"error":"queue_missing"}\n\n'
+                return
             while True:
-                with jobs_lock:
-                    job = jobs.get(job_id)
-                if not job:
-                    yield 'event: error\ndata: {"error":"not_found"}\n\n'
-                    return
-                q: Queue = job.get('queue')  # type: ignore
-                if q is None:
-                    yield 'event: error\ndata: {"error":"queue_missing"}\n\n'
-                    return
                 try:
-                    item = q.get(timeout=5)
-                except Exception:
+                    item = q.get(timeout=SSE_HEARTBEAT_SECS)
+                except Empty:
                     # heartbeat to keep connection alive
                     yield 'event: ping\ndata: {}\n\n'
                     continue
-                if item:
-                    yield f"data: {json.dumps(item)}\n\n"
-                    if item.get('type') == 'final':
-                        return
+                if item is None:
+                    # Job evicted while streaming
+                    yield 'event: error\ndata: {"error":"not_found"}\n\n'
+                    return
+                yield f"data: {json.dumps(item)}\n\n"
+                if item.get('type') == 'final':
+                    return
         return Response(stream_with_context(event_gen()), mimetype='text/event-stream')
 
     def _handle_submit(async_mode: bool = False):
         user = get_authenticated_user()
         if not is_email_allowed(user):
-            return render_template('access_denied.html', disable_auth=(os.getenv('DISABLE_AUTH', 'false').lower() == 'true')), 403
+            return render_template('access_denied.html', disable_auth=app.config['DISABLE_AUTH']), 403
         text_input = request.form.get('text', '').strip()
         mode = request.form.get('mode', 'grammar')  # default to grammar
         translate_mode = mode == 'translate'
@@ -224,46 +661,37 @@ def create_app():
         session['mode'] = mode
 
         # Handle optional file upload
-        uploaded_text = ''
-        file = request.files.get('file')
+        upload_parts: Optional[Iterable[str]] = None
+        # Only multipart bodies can carry files; skip the files lookup for plain form posts
+        file = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            ext = os.path.splitext(filename)[1].lower()
+            # The name is only used for its extension; it never becomes a filesystem path
+            ext = os.path.splitext(file.filename)[1].lower()
             if ext not in app.config['UPLOAD_EXTENSIONS']:
                 flash('Unsupported file type. Please upload .txt, .md, .docx, or .pdf.', 'error')
                 return redirect(url_for('index'))
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            try:
-                if ext in ('.txt', '.md'):
-                    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                        uploaded_text = f.read()
-                elif ext == '.docx':
-                    if Document is None:
-                        flash('DOCX support not installed. Please install python-docx.', 'error')
-                        return redirect(url_for('index'))
-                    doc = Document(filepath)
-                    uploaded_text = "\n".join(p.text for p in doc.paragraphs)
-                elif ext == '.pdf':
-                    if PdfReader is None:
-                        flash('PDF support not installed. Please install PyPDF2.', 'error')
-                        return redirect(url_for('index'))
-                    reader = PdfReader(filepath)
-                    pages_text = []
-                    for p in reader.pages:
-                        try:
-                            pages_text.append(p.extract_text() or '')
-                        except Exception:
-                            pages_text.append('')
-                    uploaded_text = "\n".join(pages_text)
-            finally:
-                # Clean up file immediately (no persistence)
-                try:
-                    os.remove(filepath)
-                except Exception:
-                    pass
-
-        full_input = '\n'.join([part for part in [text_input, uploaded_text] if part])
+            # Uploads are parsed entirely in memory (bounded by MAX_CONTENT_LENGTH); nothing touches disk
+            if ext in ('.txt', '.md'):
+                upload_parts = (file.stream.read().decode('utf-8', errors='ignore'),)
+            elif ext == '.docx':
+                if Document is None:
+                    flash('DOCX support not installed. Please install python-docx.', 'error')
+                    return redirect(url_for('index'))
+                upload_parts = _iter_docx_paragraphs(file.stream)
+            elif ext == '.pdf':
+                if pdfium is None and PdfReader is None:
+                    flash('PDF support not installed. Please install pypdfium2 or PyPDF2.', 'error')
+                    return redirect(url_for('index'))
+                upload_parts = _iter_pdf_pages(file.stream.read())
+
+        # One join over the typed text and the upload's fragments: the extracted document is
+        # never held as a separate string alongside full_input.
+        if upload_parts is None:
+            full_input = text_input
+        elif text_input:
+            full_input = '\n'.join(chain((text_input,), upload_parts))
+        else:
+            full_input = '\n'.join(upload_parts)
 
         if not full_input:
             flash('Please provide text or upload a file.', 'error')
@@ -271,7 +699,7 @@ def create_app():
 
         # Auto-detect source language for display and prompt context
         try:
-            source_lang = detect(full_input)
+            source_lang = _detect_language(full_input)
         except Exception:
             source_lang = 'unknown'
 
@@ -281,36 +709,17 @@ def create_app():
 
         # System prompts per mode
         if translate_mode:
-            # Strong instruction: only raw translated text, no labels, no commentary, NO SUMMARIZATION
-            system_prompt = (
-                "You are a professional translator. Translate the user's text from the detected source "
-                f"language ({source_lang}) to the target language ({{target_lang}}). Preserve tone, style, meaning, register, factual detail, sentence boundaries, paragraph structure, lists, numbering, and line breaks/formatting EXACTLY. "
-                "Do NOT summarize, shorten, condense, omit, merge, reorder, or add content. Every sentence, bullet, number, code block, heading, line break, and paragraph present in the input MUST appear (appropriately translated) in the output. If something is already a proper name or should remain untranslated, keep it as-is. "
-                "Return ONLY the translated text itself. Do NOT prepend labels, explanations, apologies, summaries, code fences, markdown headers, quotes, or phrases like 'Translation:', 'Here is the translation', or similar. Output strictly the final translated text. "
-                "If the input is already entirely in the target language, simply reproduce it verbatim (no changes) unless there are obvious orthographic errors."
-            ).format(target_lang=target_language or 'auto')
+            system_prompt = TRANSLATE_SYSTEM_PROMPT_TEMPLATE.format(source_lang=source_lang, target_lang=target_language or 'auto')
         else:
-            system_prompt = (
-                "You are an expert copy editor. Improve grammar, spelling, punctuation, clarity, and style while preserving meaning, tone, voice, emphasis, formatting, sentence order, paragraph structure, lists, numbering, headings, code blocks, and line breaks EXACTLY. "
-                "ABSOLUTELY DO NOT summarize, shorten, condense, omit, merge, or reorder content. Do not remove redundancy unless it is a clear grammatical error; err on the side of preserving all words. If a sentence is already correct, leave it unchanged. "
-                "Return ONLY the fully corrected text itself with no added labels, no introductory phrases, no explanations, no commentary, no code fences, and no quotes. Do NOT output phrases like 'Corrected text:', 'Here is', or similar. "
-                "If the language is German then apply these rules: "
-                "1. Zeitform (Präteritum / Präsens): Erzählung meist im Präteritum, direkte Rede im Präsens. "
-                "2. Anführungszeichen: Deutsch: „…“ (Duden-Norm). "
-                "3. Gedankenstriche: Deutsch: Halbgeviertstrich (–) mit Leerzeichen. "
-                "4. Absätze / Einrückungen: Einheitlich (Einrückung oder Leerzeile). "
-                "5. Lesbarkeit: Einheitliche Typografie, keine Übersetzungsreste. Typografieregeln folgen der Zielsprache. "
-                "Output ONLY the fully corrected text, nothing else."
-            )
+            system_prompt = GRAMMAR_SYSTEM_PROMPT
 
     # Chunking configuration
         # Note: GPT-4o has a very large context window, but we keep a safe input budget.
-        max_input_tokens_env = int(os.getenv('MAX_INPUT_TOKENS', '12000'))
-        encoding_name = os.getenv('TIKTOKEN_ENCODING', 'o200k_base')
+        max_input_tokens_env = app.config['MAX_INPUT_TOKENS']
         # Ensure chunk input token budget aligns with output token capacity to minimize truncation risk.
         # Heuristic: grammar editing requires roughly 1:1 output length; translation may expand slightly.
         # Clamp chunk size so that expected output can fit within max_output_tokens.
-        planned_max_output_tokens = int(os.getenv('MAX_OUTPUT_TOKENS', '2048'))
+        planned_max_output_tokens = app.config['MAX_OUTPUT_TOKENS']
         if mode == 'grammar':
             safe_input_budget = int(planned_max_output_tokens * 0.9)
         elif translate_mode:
@@ -321,7 +730,7 @@ def create_app():
         safe_input_budget = max(50, safe_input_budget)
         effective_input_tokens = min(max_input_tokens_env, safe_input_budget)
         input_clamped = effective_input_tokens < max_input_tokens_env
-        chunks = chunk_text_by_tokens(full_input, max_tokens=effective_input_tokens, encoding_name=encoding_name)
+        chunks = chunk_text_by_tokens(full_input, max_tokens=effective_input_tokens, encoding=encoding)
         if input_clamped:
             # Record a metric so operators know clamping occurred.
             _persist_metric({'event': 'input_token_budget_clamped', 'mode': mode, 'original_max_input_tokens': max_input_tokens_env, 'effective_input_tokens': effective_input_tokens, 'planned_max_output_tokens': planned_max_output_tokens})
@@ -330,47 +739,56 @@ def create_app():
         # Store per-chunk responses (may include empty strings). Keep None until processed.
         responses: List[Optional[str]] = [None] * len(chunks)
         error_message: Optional[str] = None
-        chunk_metrics: List[Dict[str, Any]] = []  # one per chunk
+        chunk_metrics: List[Dict[str, Any]] = []  # one per chunk, only kept with DEBUG_METRICS
+        collect_chunk_metrics = app.config['DEBUG_METRICS']
+        counters = ChunkCounters()
+        # Set when the job fails: prefetched chunk calls stop before their next attempt or backoff
+        job_aborted = threading.Event()
         warnings: List[str] = []  # job-level warnings surfaced to UI
         job_id: Optional[str] = None
         if async_mode:
             job_id = _create_job_id()
-            with jobs_lock:
-                jobs[job_id] = {
+            job_store, job_lock = _job_shard(job_id)
+            with job_lock:
+                job_store[job_id] = {
                     'id': job_id,
                     'status': 'pending',
-                    'created_utc': datetime.utcnow().isoformat() + 'Z',
+                    'created_utc': _utc_timestamp(),
+                    'created_epoch': time.time(),
                     'mode': mode,
                     'chunks_total': len(chunks),
                     'chunks_completed': 0,
                     'chunks_failed': 0,
+                    'chunks_retried': 0,
                     'progress_percent': 0.0,
                     'result': None,
                     'error': None,
                     'metrics': [],
                     'warnings': [],
-                    'queue': Queue(maxsize=100),  # SSE event queue
+                    'usage': {},  # aggregated token usage, filled in when the job finishes
+                    'queue': SimpleQueue(),  # SSE event queue
                 }
 
-        # Parallelism removed: process chunks strictly sequentially.
-        # (MAX_PARALLEL_REQUESTS environment variable is now ignored for compatibility.)
-        _ = os.getenv('MAX_PARALLEL_REQUESTS')  # kept for backward compatibility (no functional effect)
-        temperature = float(os.getenv('AOAI_TEMPERATURE', '0.2'))
-        max_output_tokens = int(os.getenv('MAX_OUTPUT_TOKENS', '2048'))
-        deployment = os.getenv('AZURE_OPENAI_DEPLOYMENT')
+        # Chunk calls are independent: up to MAX_PARALLEL_REQUESTS of them (never more than half
+        # the shared pool) run ahead while results are still consumed (and post-processed) in order.
+        max_parallel = min(app.config['MAX_PARALLEL_REQUESTS'], max(1, chunk_pool_size // 2))
+        temperature = app.config['AOAI_TEMPERATURE']
+        max_output_tokens = planned_max_output_tokens
+        deployment = app.config['AZURE_OPENAI_DEPLOYMENT']
 
         # Retry configuration
-        retry_max_attempts = max(1, int(os.getenv('RETRY_MAX_ATTEMPTS', '3')))
-        retry_base_delay = float(os.getenv('RETRY_BASE_DELAY_SECS', '1.0'))
-        retry_backoff = float(os.getenv('RETRY_BACKOFF_FACTOR', '2.0'))
-        retry_jitter = float(os.getenv('RETRY_JITTER_SECS', '0.25'))
-        retryable_codes_env = os.getenv('RETRY_STATUS_CODES', '429,500,502,503,504')
-        retryable_status_codes = [int(c.strip()) for c in retryable_codes_env.split(',') if c.strip().isdigit()]
-        circuit_breaker_threshold = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '3'))
+        retry_max_attempts = app.config['RETRY_MAX_ATTEMPTS']
+        retry_base_delay = app.config['RETRY_BASE_DELAY_SECS']
+        retry_backoff = app.config['RETRY_BACKOFF_FACTOR']
+        retry_jitter = app.config['RETRY_JITTER_SECS']
+        retryable_status_codes = app.config['RETRY_STATUS_CODES']
+        circuit_breaker_threshold = app.config['CIRCUIT_BREAKER_FAILURE_THRESHOLD']
         consecutive_failures = 0
-        long_chunk_threshold_secs = float(os.getenv('LONG_CHUNK_THRESHOLD_SECS', '30'))
+        long_chunk_threshold_secs = app.config['LONG_CHUNK_THRESHOLD_SECS']
 
         start_time = time.time()
+        # Chunk responses obtained up front from a Batch API run; consumed by the first attempt
+        batch_results: Dict[int, Dict[str, Any]] = {}
 
         def process_chunk_with_retry(idx: int, ch_text: str) -> Tuple[int, str, Dict[str, Any]]:
             attempt = 0
@@ -378,11 +796,18 @@ def create_app():
             last_error: Optional[str] = None
             while True:
                 attempt += 1
+                if job_aborted.is_set():
+                    raise ChunkAborted(f"Chunk {idx} skipped: job aborted")
                 try:
                     t0 = time.time()
+                    batched = batch_results.pop(idx, None) if attempt == 1 else None
+                    if batched is not None:
+                        content_local = batched.get('content', '')
+                        finish_reason_local = batched.get('finish_reason')
+                        usage_local = batched.get('usage')
                     # Use meta-aware call to detect truncation
                     # Support tests that monkeypatch only call_chat_completion (not the meta variant)
-                    if hasattr(azure_openai_client, 'call_chat_completion_with_meta') and not app.config.get('TESTING'):
+                    elif hasattr(azure_openai_client, 'call_chat_completion_with_meta') and not app.config.get('TESTING'):
                         meta_resp = azure_openai_client.call_chat_completion_with_meta(
                             system_prompt=system_prompt,
                             user_content=ch_text,
@@ -392,6 +817,7 @@ def create_app():
                         )
                         content_local = meta_resp.get('content','')
                         finish_reason_local = meta_resp.get('finish_reason')
+                        usage_local = meta_resp.get('usage')
                     else:
                         content_local = azure_openai_client.call_chat_completion(
                             system_prompt=system_prompt,
@@ -401,6 +827,7 @@ def create_app():
                             max_output_tokens=max_output_tokens,
                         )
                         finish_reason_local = None
+                        usage_local = None
                     duration_call = time.time() - t0
                     cleaned = sanitize_model_output(content_local)
                     in_len = len(ch_text)
@@ -424,6 +851,7 @@ def create_app():
                         **metric,
                     }
                     _persist_metric(metric_line)
+                    counters.record_call(attempt, usage_local)
                     return idx, cleaned, metric
                 except Exception as exc:  # Controlled retry logic
                     last_error = str(exc)
@@ -439,13 +867,14 @@ def create_app():
                         }
                         _log_json('chunk_failed', **metric)
                         _persist_metric({'event': 'chunk_failed', 'mode': mode, 'job_id': job_id, **metric})
+                        counters.record_call(attempt)
                         raise
                     delay = retry_base_delay * (retry_backoff ** (attempt - 1))
                     if retry_jitter > 0:
                         delay += random.uniform(0, retry_jitter)
                     _log_json('chunk_retrying', chunk_index=idx, attempt=attempt, next_delay_secs=round(delay, 3), error=str(exc), retryable=retryable)
                     _persist_metric({'event': 'chunk_retrying', 'mode': mode, 'job_id': job_id, 'chunk_index': idx, 'attempt': attempt, 'delay': round(delay,3), 'error': str(exc), 'retryable': retryable})
-                    time.sleep(delay)
+                    job_aborted.wait(delay)  # woken early if the job aborts; checked at the loop top
 
         def _execute_job(job_id_local: Optional[str]=None):
             nonlocal error_message, consecutive_failures, warnings
@@ -501,6 +930,7 @@ def create_app():
                                     temperature=temperature,
                                     max_output_tokens=max_output_tokens,
                                 )
+                                counters.add_usage(meta_r.get('usage'))
                                 seg_out = sanitize_model_output(meta_r.get('content',''))
                             else:
                                 seg_out = sanitize_model_output(azure_openai_client.call_chat_completion(
@@ -526,13 +956,13 @@ def create_app():
                                f" Initial chars={len(initial_output)} vs input chars={len(original_text)}."
                     warnings.append(warn_msg)
                     if async_mode and job_id_local:
-                        with jobs_lock:
-                            job = jobs.get(job_id_local)
+                        with job_lock:
+                            job = job_store.get(job_id_local)
                             if job:
                                 job_w = job.get('warnings', [])
                                 job_w.append(warn_msg)
                                 job['warnings'] = job_w
-                                q: Queue = job.get('queue')  # type: ignore
+                                q: SimpleQueue = job.get('queue')  # type: ignore
                                 if q:
                                     try:
                                         q.put_nowait({'type': 'warning', 'message': warn_msg})
@@ -550,53 +980,81 @@ def create_app():
                                f" Initial={len(initial_output)} vs recovered={len(recovered_output)} chars."
                     warnings.append(warn_msg)
                     if async_mode and job_id_local:
-                        with jobs_lock:
-                            job = jobs.get(job_id_local)
+                        with job_lock:
+                            job = job_store.get(job_id_local)
                             if job:
                                 job_w = job.get('warnings', [])
                                 job_w.append(warn_msg)
                                 job['warnings'] = job_w
-                                q: Queue = job.get('queue')  # type: ignore
+                                q: SimpleQueue = job.get('queue')  # type: ignore
                                 if q:
                                     try:
                                         q.put_nowait({'type': 'warning', 'message': warn_msg})
                                     except Exception:
                                         pass
                     return initial_output, False
-            # Unified sequential processing
+            if async_mode and app.config['AOAI_BATCH_ENABLED'] and len(chunks) >= app.config['AOAI_BATCH_MIN_CHUNKS']:
+                # Large job: submit every chunk as one Batch API job (cheaper, but can take up to the
+                # completion window). Chunks missing from the output go through the live path below.
+                _persist_metric({'event': 'batch_submitted', 'mode': mode, 'job_id': job_id_local, 'chunks': len(chunks)})
+                try:
+                    batched_responses = azure_openai_client.run_batch_chat_completions(
+                        system_prompt=system_prompt,
+                        user_contents=chunks,
+                        deployment_name=app.config['AOAI_BATCH_DEPLOYMENT'],
+                        temperature=temperature,
+                        max_output_tokens=max_output_tokens,
+                        poll_interval_secs=app.config['AOAI_BATCH_POLL_SECS'],
+                        timeout_secs=app.config['AOAI_BATCH_TIMEOUT_SECS'],
+                    )
+                    batch_results.update((i, r) for i, r in enumerate(batched_responses) if r is not None)
+                    _persist_metric({'event': 'batch_completed', 'mode': mode, 'job_id': job_id_local, 'chunks': len(chunks), 'chunks_returned': len(batch_results)})
+                except Exception as e:
+                    _log_json('batch_failed', job_id=job_id_local, error=str(e))
+                    _persist_metric({'event': 'batch_failed', 'mode': mode, 'job_id': job_id_local, 'error': str(e)})
+
+            # In-order processing; model calls for the next chunks are prefetched concurrently
+            executor = chunk_executor if max_parallel > 1 and len(chunks) > 1 else None
+            pending: Dict[int, Future] = {}
             for idx, ch_text in enumerate(chunks):
                 if error_message:
                     break
+                if executor is not None:
+                    for ahead in range(idx, min(len(chunks), idx + max_parallel)):
+                        if ahead not in pending:
+                            pending[ahead] = executor.submit(process_chunk_with_retry, ahead, chunks[ahead])
                 try:
                     # Emit chunk start SSE + metric
                     if async_mode and job_id_local:
-                        with jobs_lock:
-                            job = jobs.get(job_id_local)
+                        with job_lock:
+                            job = job_store.get(job_id_local)
                             if job:
                                 job['current_chunk'] = idx
-                                q: Queue = job.get('queue')  # type: ignore
+                                q: SimpleQueue = job.get('queue')  # type: ignore
                                 if q:
                                     try:
                                         q.put_nowait({'type': 'chunk_start', 'chunk_index': idx, 'chunks_total': len(chunks)})
                                     except Exception:
                                         pass
                     chunk_call_start = time.time()
-                    _, cleaned_seq, metric = process_chunk_with_retry(idx, ch_text)
+                    future = pending.pop(idx, None)
+                    _, cleaned_seq, metric = future.result() if future is not None else process_chunk_with_retry(idx, ch_text)
                     responses[idx] = cleaned_seq
-                    chunk_metrics.append(metric)
+                    if collect_chunk_metrics:
+                        chunk_metrics.append(metric)
                     call_elapsed = metric.get('call_duration_secs') or (time.time() - chunk_call_start)
                     if call_elapsed and call_elapsed > long_chunk_threshold_secs:
                         warn_msg = f"Chunk {idx} processing time {call_elapsed:.1f}s exceeded threshold {long_chunk_threshold_secs:.1f}s.";
                         warnings.append(warn_msg)
                         _persist_metric({'event': 'chunk_slow', 'mode': mode, 'job_id': job_id_local, 'chunk_index': idx, 'duration_secs': call_elapsed, 'threshold_secs': long_chunk_threshold_secs})
                         if async_mode and job_id_local:
-                            with jobs_lock:
-                                job = jobs.get(job_id_local)
+                            with job_lock:
+                                job = job_store.get(job_id_local)
                                 if job:
                                     job_w = job.get('warnings', [])
                                     job_w.append(warn_msg)
                                     job['warnings'] = job_w
-                                    q: Queue = job.get('queue')  # type: ignore
+                                    q: SimpleQueue = job.get('queue')  # type: ignore
                                     if q:
                                         try:
                                             q.put_nowait({'type': 'warning', 'message': warn_msg})
@@ -609,13 +1067,13 @@ def create_app():
                         warn_msg = f"Chunk {idx} may be truncated (finish_reason=length). Consider increasing max_output_tokens or reducing input size per chunk."
                         warnings.append(warn_msg)
                         if async_mode and job_id_local:
-                            with jobs_lock:
-                                job = jobs.get(job_id_local)
+                            with job_lock:
+                                job = job_store.get(job_id_local)
                                 if job:
                                     job_w = job.get('warnings', [])
                                     job_w.append(warn_msg)
                                     job['warnings'] = job_w
-                                    q: Queue = job.get('queue')  # type: ignore
+                                    q: SimpleQueue = job.get('queue')  # type: ignore
                                     if q:
                                         try:
                                             q.put_nowait({'type': 'warning', 'message': warn_msg})
@@ -633,13 +1091,13 @@ def create_app():
                             warn_msg = f"Chunk {idx} output significantly shorter than input (input {metric.get('input_chars')} chars vs output {metric.get('output_chars')} chars). Attempting recovery..."
                             warnings.append(warn_msg)
                             if async_mode and job_id_local:
-                                with jobs_lock:
-                                    job = jobs.get(job_id_local)
+                                with job_lock:
+                                    job = job_store.get(job_id_local)
                                     if job:
                                         job_w = job.get('warnings', [])
                                         job_w.append(warn_msg)
                                         job['warnings'] = job_w
-                                        q: Queue = job.get('queue')  # type: ignore
+                                        q: SimpleQueue = job.get('queue')  # type: ignore
                                         if q:
                                             try:
                                                 q.put_nowait({'type': 'warning', 'message': warn_msg})
@@ -662,27 +1120,28 @@ def create_app():
                         warn_msg = f"Chunk {idx} produced empty output while input had {metric.get('input_chars')} characters."
                         warnings.append(warn_msg)
                         if async_mode and job_id_local:
-                            with jobs_lock:
-                                job = jobs.get(job_id_local)
+                            with job_lock:
+                                job = job_store.get(job_id_local)
                                 if job:
                                     job_w = job.get('warnings', [])
                                     job_w.append(warn_msg)
                                     job['warnings'] = job_w
-                                    q: Queue = job.get('queue')  # type: ignore
+                                    q: SimpleQueue = job.get('queue')  # type: ignore
                                     if q:
                                         try:
                                             q.put_nowait({'type': 'warning', 'message': warn_msg})
                                         except Exception:
                                             pass
                     consecutive_failures = 0
+                    counters.record_result(True)
                     if async_mode and job_id_local:
-                        with jobs_lock:
-                            job = jobs.get(job_id_local)
+                        with job_lock:
+                            job = job_store.get(job_id_local)
                             if job:
-                                job['chunks_completed'] = sum(1 for r in responses if r is not None)
+                                job['chunks_completed'] = counters.completed
                                 total = job.get('chunks_total', 0) or 1
                                 job['progress_percent'] = round(100.0 * job['chunks_completed'] / total, 1)
-                                q: Queue = job.get('queue')  # type: ignore
+                                q: SimpleQueue = job.get('queue')  # type: ignore
                                 if q:
                                     try:
                                         q.put_nowait({'type': 'progress', 'chunks_completed': job['chunks_completed'], 'chunks_total': total, 'progress_percent': job['progress_percent']})
@@ -690,24 +1149,27 @@ def create_app():
                                         pass
                 except Exception as e:
                     consecutive_failures += 1
+                    counters.record_result(False)
                     error_message = f"Chunk {idx} failed: {e}" if not error_message else error_message
-                    chunk_metrics.append({
-                        'chunk_index': idx,
-                        'attempts': 1,
-                        'status': 'failed',
-                        'error': str(e),
-                    })
+                    job_aborted.set()
+                    if collect_chunk_metrics:
+                        chunk_metrics.append({
+                            'chunk_index': idx,
+                            'attempts': 1,
+                            'status': 'failed',
+                            'error': str(e),
+                        })
                     _log_json('chunk_error', chunk_index=idx, error=str(e), consecutive_failures=consecutive_failures)
                     _persist_metric({'event': 'chunk_error', 'mode': mode, 'job_id': job_id_local, 'chunk_index': idx, 'error': str(e), 'consecutive_failures': consecutive_failures})
                     if async_mode and job_id_local:
-                        with jobs_lock:
-                            job = jobs.get(job_id_local)
+                        with job_lock:
+                            job = job_store.get(job_id_local)
                             if job:
                                 job['chunks_failed'] = job.get('chunks_failed',0) + 1
                                 total = job.get('chunks_total', 0) or 1
                                 done = job.get('chunks_completed',0)
                                 job['progress_percent'] = round(100.0 * done / total, 1)
-                                q: Queue = job.get('queue')  # type: ignore
+                                q: SimpleQueue = job.get('queue')  # type: ignore
                                 if q:
                                     try:
                                         q.put_nowait({'type': 'error', 'message': str(e), 'chunks_failed': job['chunks_failed']})
@@ -718,19 +1180,26 @@ def create_app():
                         _log_json('circuit_breaker_open', failures=consecutive_failures, threshold=circuit_breaker_threshold)
                         _persist_metric({'event': 'circuit_breaker_open', 'mode': mode, 'job_id': job_id_local, 'failures': consecutive_failures, 'threshold': circuit_breaker_threshold})
                         break
+            # A failed job may leave prefetched calls behind: drop those not yet started, stop
+            # running ones at their next attempt, and keep any late results out of the totals
+            job_aborted.set()
+            for leftover in pending.values():
+                leftover.cancel()
+            counters.close()
             if error_message:
                 # Clear partial responses to match previous behavior (no partial output returned)
                 responses.clear()
 
             # Finalize job record if async
             if async_mode and job_id_local:
-                with jobs_lock:
-                    job = jobs.get(job_id_local)
+                with job_lock:
+                    job = job_store.get(job_id_local)
                     if job:
-                        job['chunks_completed'] = sum(1 for r in responses if r is not None)
-                        computed_failed = sum(1 for m in chunk_metrics if m.get('status')=='failed')
-                        # Preserve higher of real-time increments vs computed failures
-                        job['chunks_failed'] = max(job.get('chunks_failed', 0), computed_failed)
+                        job['chunks_completed'] = counters.completed
+                        # Preserve higher of real-time increments vs counted failures
+                        job['chunks_failed'] = max(job.get('chunks_failed', 0), counters.failed)
+                        job['chunks_retried'] = counters.retried
+                        job['usage'] = dict(counters.usage)
                         if error_message:
                             job['status'] = 'failed'
                             job['error'] = error_message
@@ -741,22 +1210,22 @@ def create_app():
                         job['progress_percent'] = round(100.0 * job['chunks_completed'] / total, 1)
                         job['metrics'] = chunk_metrics
                         job['warnings'] = warnings
-                        q: Queue = job.get('queue')  # type: ignore
+                        q: SimpleQueue = job.get('queue')  # type: ignore
                         if q:
                             try:
                                 q.put_nowait({'type': 'final', 'status': job['status'], 'error': job.get('error'), 'progress_percent': job['progress_percent'], 'warnings': warnings})
                             except Exception:
                                 pass
                 total_duration_local = time.time() - start_time
-                _persist_metric({'event': 'job_finished', 'mode': mode, 'job_id': job_id_local, 'status': 'failed' if error_message else 'succeeded', 'duration_secs': round(total_duration_local,3)})
+                _persist_metric({'event': 'job_finished', 'mode': mode, 'job_id': job_id_local, 'status': 'failed' if error_message else 'succeeded', 'duration_secs': round(total_duration_local,3), 'usage': dict(counters.usage)})
 
         if async_mode:
             # Launch background thread
             def _run():
-                with jobs_lock:
-                    if job_id and job_id in jobs:
-                        jobs[job_id]['status'] = 'running'
-                        q: Queue = jobs[job_id].get('queue')  # type: ignore
+                with job_lock:
+                    if job_id and job_id in job_store:
+                        job_store[job_id]['status'] = 'running'
+                        q: SimpleQueue = job_store[job_id].get('queue')  # type: ignore
                         if q:
                             try:
                                 q.put_nowait({'type': 'started'})
@@ -767,11 +1236,23 @@ def create_app():
                     _execute_job(job_id)
                 except Exception as e:
                     _persist_metric({'event': 'job_thread_exception', 'mode': mode, 'job_id': job_id, 'error': str(e)})
+                    # Fail the job so the evictor can reclaim it and its stream gets a final event
+                    with job_lock:
+                        job = job_store.get(job_id)
+                        if job and job.get('status') in ('pending', 'running'):
+                            job['status'] = 'failed'
+                            job['error'] = f"Processing failed unexpectedly: {e}"
+                            q: SimpleQueue = job.get('queue')  # type: ignore
+                            if q:
+                                try:
+                                    q.put_nowait({'type': 'final', 'status': 'failed', 'error': job['error'], 'progress_percent': job.get('progress_percent', 0.0), 'warnings': job.get('warnings', [])})
+                                except Exception:
+                                    pass
             threading.Thread(target=_run, daemon=True).start()
             # Render page with job id placeholder; front-end will poll
-            lang = session.get('ui_lang', os.getenv('UI_LANG', 'en'))
+            lang = session.get('ui_lang', app.config['UI_LANG'])
             strings = get_strings(lang)
-            history = session.get('history', [])
+            history = _get_history(user)
             return render_template('index.html',
                                    user=user,
                                    result=None,
@@ -804,32 +1285,24 @@ def create_app():
         final_output = '\n'.join((r if r is not None else '') for r in responses)
         total_duration = time.time() - start_time
 
-        # Session-only conversation history
-        history = session.get('history', [])
-        # Summaries
-        success_count = sum(1 for m in chunk_metrics if m.get('status') == 'success')
-        failed_count = sum(1 for m in chunk_metrics if m.get('status') == 'failed')
-        retried_chunks = sum(1 for m in chunk_metrics if m.get('attempts', 1) > 1)
-
-        history.append({
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
+        history = _append_history(user, {
+            'timestamp': _utc_timestamp(),
             'mode': mode,
             'source_lang': source_lang,
             'target_lang': target_language if translate_mode else None,
-            'input_preview': (full_input[:500] + ('…' if len(full_input) > 500 else '')),
-            'output_preview': (final_output[:500] + ('…' if len(final_output) > 500 else '')),
+            'input_preview': _preview(full_input),
+            'output_preview': _preview(final_output),
             'chunks': len(chunks),
             'duration_seconds': round(total_duration, 3),
-            'chunks_success': success_count,
-            'chunks_failed': failed_count,
-            'chunks_retried': retried_chunks,
+            'chunks_success': counters.completed,
+            'chunks_failed': counters.failed,
+            'chunks_retried': counters.retried,
         })
-        session['history'] = history
 
         # user already resolved above for allowlist
-        lang = session.get('ui_lang', os.getenv('UI_LANG', 'en'))
+        lang = session.get('ui_lang', app.config['UI_LANG'])
         strings = get_strings(lang)
-        _persist_metric({'event': 'job_finished_sync', 'mode': mode, 'chunks': len(chunks), 'status': 'succeeded', 'duration_secs': round(total_duration,3)})
+        _persist_metric({'event': 'job_finished_sync', 'mode': mode, 'chunks': len(chunks), 'status': 'succeeded', 'duration_secs': round(total_duration,3), 'usage': dict(counters.usage)})
         return render_template('index.html',
                                user=user,
                                result=final_output,
@@ -857,17 +1330,47 @@ def create_app():
     @app.post('/set-lang')
     def set_lang():
         lang = request.form.get('lang', 'en').lower()
-        if lang not in ('en', 'de'):
+        if lang not in _VALID_UI_LANGS:
             lang = 'en'
-        session['ui_lang'] = lang
+        # Assigning marks the session modified (re-signed and re-sent) even when nothing changed
+        if session.get('ui_lang') != lang:
+            session['ui_lang'] = lang
         return redirect(url_for('index'))
 
+    # Azure's load-balancer probe hits GET /health every few seconds; answer it at the WSGI
+    # layer so probes skip request-context setup, session decoding and teardown entirely.
+    flask_wsgi_app = app.wsgi_app
+    health_body = b'{"status":"ok"}'
+    health_headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(health_body)))]
+
+    def fast_health_wsgi_app(environ, start_response):
+        if environ.get('PATH_INFO') == '/health' and environ.get('REQUEST_METHOD') == 'GET':
+            start_response('200 OK', list(health_headers))
+            return [health_body]
+        return flask_wsgi_app(environ, start_response)
+
+    app.wsgi_app = fast_health_wsgi_app  # type: ignore[method-assign]
+
     return app
 
 
 app = create_app()
 
 
+# Boilerplate patterns stripped from model output (compiled once, used on every chunk)
+_FENCED_RE = re.compile(r'^```[a-zA-Z0-9_-]*\n([\s\S]*?)\n```$', re.MULTILINE)
+# One anchored pass over the head of the output, in order: an optional 'Here is the ...' lead
+# phrase, an optional label line ('Translation:' + newlines), and an optional label that is all
+# that is left
+_BOILERPLATE_PREFIX_RE = re.compile(
+    r'^(?:here (?:is|are) (?:the )?(?:translation|corrected text|correction)\s*:?\s*)?'
+    r'(?:(?:translation|translated text|corrected text|correction)\s*:?\s*\n+)?'
+    r'(?:(?:translation|translated text|corrected text|correction)\s*:?\s*$)?',
+    re.IGNORECASE)
+# Every pattern above is anchored on one of these (lowercased) openings
+_BOILERPLATE_OPENINGS = ('```', 'here ', 'translat', 'correct')
+
+
 def sanitize_model_output(text: str) -> str:
     """Remove common leading boilerplate or labels the model might still emit.
 
@@ -882,32 +1385,36 @@ def sanitize_model_output(text: str) -> str:
         return ""
     original = text
     t = text.strip()
-
-    # Remove surrounding ``` blocks if they wrap the entire content
-    fenced_pattern = re.compile(r'^```[a-zA-Z0-9_-]*\n([\s\S]*?)\n```$', re.MULTILINE)
-    m = fenced_pattern.match(t)
-    if m:
-        t = m.group(1).strip()
-
-    # Remove leading phrases like 'Here is the translation:' etc. (case-insensitive)
-    lead_phrase_pattern = re.compile(r'^(here (is|are) (the )?(translation|corrected text|correction)\s*:?)\s*', re.IGNORECASE)
-    t = lead_phrase_pattern.sub('', t)
-
-    # Remove single leading label lines e.g. 'Translation:' or 'Corrected text:'
-    label_pattern = re.compile(r'^(translation|translated text|corrected text|correction)\s*:?\s*\n+', re.IGNORECASE)
-    t = label_pattern.sub('', t)
-
-    # If after cleaning first line is still just the label (without newline), strip it
-    one_line_label = re.compile(r'^(translation|translated text|corrected text|correction)\s*:?\s*$', re.IGNORECASE)
-    if one_line_label.match(t):
-        t = ''
-
-    # Collapse excessive leading blank lines
-    t = re.sub(r'^(\s*\n){1,}', '', t)
+    # Most outputs are clean: skip the regex pipeline unless a boilerplate opening is present
+    if not t[:16].lower().startswith(_BOILERPLATE_OPENINGS):
+        return t if t else original.strip()
+
+    # Remove surrounding ``` blocks if they wrap the entire content (cheap literal check first;
+    # most outputs are unfenced and never need the regex)
+    if t.startswith('```') and t.endswith('```'):
+        m = _FENCED_RE.match(t)
+        if m:
+            t = m.group(1).strip()
+
+    # Remove leading phrases like 'Here is the translation:' and label lines like 'Corrected text:'
+    # (case-insensitive); a label with nothing after it empties t and falls back to the original
+    t = _BOILERPLATE_PREFIX_RE.sub('', t, count=1)
+
+    # Collapse excessive leading blank lines: drop leading whitespace up to its last newline
+    # (indentation of the first real line is kept)
+    head = len(t) - len(t.lstrip())
+    if head:
+        t = t[t.rfind('\n', 0, head) + 1:]
 
     # Final trim
     t = t.strip('\n')
     return t if t else original.strip()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '8000')), debug=True)
+    port = int(os.getenv('PORT', '8000'))
+    if os.getenv('USE_WAITRESS', 'false').lower() == 'true':
+        # Multi-threaded server for smoke/load runs, so concurrent requests and jobs overlap
+        from waitress import serve  # type: ignore
+        serve(app, host='0.0.0.0', port=port, threads=int(os.getenv('WAITRESS_THREADS', '8')))
+    else:
+        app.run(host='0.0.0.0', port=port, debug=True)
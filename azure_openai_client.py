@@ -1,9 +1,22 @@
 import os
-from typing import Optional
+import json
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
 
 import httpx
 from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from azure.identity import (AzureCliCredential, ChainedTokenCredential, DefaultAzureCredential,
+                            ManagedIdentityCredential, get_bearer_token_provider)
+
+try:
+    import h2  # noqa: F401  # optional: lets httpx speak HTTP/2 (pip install httpx[http2])
+    _HTTP2_AVAILABLE = True
+except Exception:
+    _HTTP2_AVAILABLE = False
 
 # Notes:
 # - This module wraps Azure OpenAI Chat Completions calls using the 'openai' SDK v1+ with Azure endpoints.
@@ -12,21 +25,118 @@ from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 #   AZURE_OPENAI_DEPLOYMENT: the deployment name for gpt-4o
 #   AZURE_OPENAI_API_VERSION: e.g., 2024-06-01
 
+logger = logging.getLogger("text_assistant")
+
 _client: Optional[AzureOpenAI] = None
+# The credential keeps its own token cache, so one provider is shared by every client built in
+# this process (and by concurrent first callers) instead of a fresh credential per client.
+_token_provider: Optional[Callable[[], str]] = None
+_client_lock = threading.Lock()
+
+# Opt-in streamed responses: the read timeout then applies between streamed deltas instead of
+# to the whole generation, so long outputs no longer race AOAI_HTTP_TIMEOUT.
+_STREAM_RESPONSES = os.getenv('AOAI_STREAM', 'false').lower() == 'true'
+
+# stream_options is rejected by API versions before 2024-09-01, so it is only sent when supported
+_STREAM_USAGE_OPTIONS: Dict[str, Any] = (
+    {'stream_options': {'include_usage': True}}
+    if os.getenv('AZURE_OPENAI_API_VERSION', '2024-06-01') >= '2024-09-01' else {}
+)
+
+# Token usage fields reported per call; callers sum these across a job's chunks
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'total_tokens')
+
+
+# Deterministic (temperature 0) responses are memoised in a small LRU keyed by a digest of the
+# full request, so re-submitted texts and repeated chunks skip the round-trip entirely.
+_RESPONSE_CACHE_SIZE = int(os.getenv('AOAI_RESPONSE_CACHE_SIZE', '512'))
+_response_cache: "OrderedDict[bytes, Any]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _response_cache_key(kind: str, system_prompt: str, user_content: str, deployment: str,
+                        temperature: float, max_output_tokens: int) -> Optional[bytes]:
+    if temperature != 0 or _RESPONSE_CACHE_SIZE <= 0:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    for part in (kind, system_prompt, user_content, deployment, repr(temperature), str(max_output_tokens)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.digest()
+
+
+def _response_cache_get(key: Optional[bytes]) -> Any:
+    if key is None:
+        return None
+    with _response_cache_lock:
+        value = _response_cache.get(key)
+        if value is not None:
+            _response_cache.move_to_end(key)
+        return value
+
+
+def _response_cache_put(key: Optional[bytes], value: Any) -> None:
+    if key is None:
+        return
+    with _response_cache_lock:
+        _response_cache[key] = value
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _build_credential():
+    """Pick a short, deterministic credential chain for where the app is running.
+
+    On Azure App Service (or when AZURE_RUNTIME=app_service) only the managed identity is tried,
+    with the Azure CLI as a last resort; locally (AZURE_RUNTIME=local, or no App Service
+    environment detected) DefaultAzureCredential keeps the usual developer sign-in options.
+    """
+    runtime = os.getenv('AZURE_RUNTIME')
+    if runtime is None:
+        on_app_service = bool(os.getenv('IDENTITY_ENDPOINT') or os.getenv('WEBSITE_INSTANCE_ID'))
+        runtime = 'app_service' if on_app_service else 'local'
+    if runtime == 'local':
+        return DefaultAzureCredential()
+    # AZURE_CLIENT_ID selects a user-assigned identity; unset means the system-assigned one
+    return ChainedTokenCredential(
+        ManagedIdentityCredential(client_id=os.getenv('AZURE_CLIENT_ID')),
+        AzureCliCredential(),
+    )
+
+
+def get_token_provider() -> Callable[[], str]:
+    """Return the process-wide bearer token provider for Azure OpenAI, creating it on first use."""
+    global _token_provider
+    if _token_provider is None:
+        with _client_lock:
+            if _token_provider is None:
+                _token_provider = get_bearer_token_provider(_build_credential(), "https://cognitiveservices.azure.com/.default")
+    return _token_provider
 
 
 def get_client() -> AzureOpenAI:
     global _client
-    if _client is None:
-        endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
-        api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2024-06-01')
-        if not endpoint:
-            raise RuntimeError('Missing AZURE_OPENAI_ENDPOINT')
-        # Managed Identity token provider
-        credential = DefaultAzureCredential()
-        token_provider = get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default")
+    if _client is not None:
+        return _client
+    endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
+    api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2024-06-01')
+    if not endpoint:
+        raise RuntimeError('Missing AZURE_OPENAI_ENDPOINT')
+    token_provider = get_token_provider()
+    with _client_lock:
+        if _client is not None:
+            return _client
         timeout = float(os.getenv('AOAI_HTTP_TIMEOUT', '60'))
-        http_client = httpx.Client(timeout=timeout)
+        # One pooled transport for every call to the endpoint: kept-alive connections (multiplexed
+        # over HTTP/2 when h2 is installed) avoid a TLS handshake per chunk. Retries stay with the
+        # app's backoff/circuit-breaker logic rather than the transport.
+        transport = httpx.HTTPTransport(
+            http2=_HTTP2_AVAILABLE,
+            retries=0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0),
+        )
+        http_client = httpx.Client(timeout=timeout, transport=transport)
         _client = AzureOpenAI(
             azure_endpoint=endpoint,
             api_version=api_version,
@@ -36,6 +146,13 @@ def get_client() -> AzureOpenAI:
     return _client
 
 
+def prewarm() -> None:
+    """Build the client, fetch the first token and open a pooled connection ahead of the first request."""
+    client = get_client()
+    get_token_provider()()
+    client.models.list()
+
+
 def call_chat_completion(system_prompt: str,
                          user_content: str,
                          deployment_name: Optional[str] = None,
@@ -44,10 +161,14 @@ def call_chat_completion(system_prompt: str,
     """
     Call Azure OpenAI Chat Completions API and return the text content.
     """
-    client = get_client()
     deployment = deployment_name or os.getenv('AZURE_OPENAI_DEPLOYMENT')
     if not deployment:
         raise RuntimeError('Missing deployment name. Set AZURE_OPENAI_DEPLOYMENT env var.')
+    cache_key = _response_cache_key('text', system_prompt, user_content, deployment, temperature, max_output_tokens)
+    cached = _response_cache_get(cache_key)
+    if cached is not None:
+        return cached
+    client = get_client()
 
     # Compose messages
     messages = [
@@ -65,7 +186,9 @@ def call_chat_completion(system_prompt: str,
     if not resp.choices:
         raise RuntimeError('No choices returned from Azure OpenAI response.')
 
-    return resp.choices[0].message.content or ""
+    content = resp.choices[0].message.content or ""
+    _response_cache_put(cache_key, content)
+    return content
 
 
 def call_chat_completion_with_meta(system_prompt: str,
@@ -76,15 +199,24 @@ def call_chat_completion_with_meta(system_prompt: str,
     """Extended variant returning content plus finish_reason & token usage.
 
     Returns dict: { 'content': str, 'finish_reason': str|None, 'usage': {...} }
+    A response served from the temperature-0 cache has empty usage and 'cached': True.
     """
-    client = get_client()
     deployment = deployment_name or os.getenv('AZURE_OPENAI_DEPLOYMENT')
     if not deployment:
         raise RuntimeError('Missing deployment name. Set AZURE_OPENAI_DEPLOYMENT env var.')
+    cache_key = _response_cache_key('meta', system_prompt, user_content, deployment, temperature, max_output_tokens)
+    cached = _response_cache_get(cache_key)
+    if cached is not None:
+        return {**cached, 'usage': {}, 'cached': True}
+    client = get_client()
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_content}
     ]
+    if _STREAM_RESPONSES:
+        result = _stream_chat_completion(client, deployment, messages, temperature, max_output_tokens)
+        _response_cache_put(cache_key, result)
+        return result
     resp = client.chat.completions.create(
         model=deployment,
         messages=messages,
@@ -96,12 +228,134 @@ def call_chat_completion_with_meta(system_prompt: str,
     choice = resp.choices[0]
     finish_reason = getattr(choice, 'finish_reason', None)
     content = choice.message.content or ""
-    usage = getattr(resp, 'usage', None)
-    usage_dict = {}
-    if usage:
-        # SDK usage object has attributes like prompt_tokens, completion_tokens, total_tokens
-        for attr in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
-            val = getattr(usage, attr, None)
-            if val is not None:
-                usage_dict[attr] = val
-    return {'content': content, 'finish_reason': finish_reason, 'usage': usage_dict}
+    result = {'content': content, 'finish_reason': finish_reason, 'usage': _usage_dict(getattr(resp, 'usage', None))}
+    _response_cache_put(cache_key, result)
+    return result
+
+
+def _usage_dict(usage: Any) -> Dict[str, int]:
+    """Pick the reported USAGE_FIELDS off an SDK usage object (empty when there is none)."""
+    if usage is None:
+        return {}
+    return {attr: val for attr in USAGE_FIELDS if (val := getattr(usage, attr, None)) is not None}
+
+
+def _stream_chat_completion(client: AzureOpenAI,
+                            deployment: str,
+                            messages: List[Dict[str, str]],
+                            temperature: float,
+                            max_output_tokens: int) -> dict:
+    """Streamed counterpart of call_chat_completion_with_meta (same return shape).
+
+    Deltas are accumulated into the full content. Token usage is requested as a final stream
+    event, which Azure only honours from API version 2024-09-01(-preview); on older versions
+    'usage' stays empty.
+    """
+    stream = client.chat.completions.create(
+        model=deployment,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_output_tokens,
+        stream=True,
+        **_STREAM_USAGE_OPTIONS,
+    )
+    parts: List[str] = []
+    finish_reason = None
+    usage_dict: Dict[str, int] = {}
+    saw_choice = False
+    for event in stream:
+        usage = getattr(event, 'usage', None)
+        if usage:
+            usage_dict = _usage_dict(usage)
+        if not event.choices:
+            continue  # e.g. Azure's leading prompt-filter event
+        saw_choice = True
+        choice = event.choices[0]
+        if choice.delta and choice.delta.content:
+            parts.append(choice.delta.content)
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+    if not saw_choice:
+        raise RuntimeError('No choices returned from Azure OpenAI response.')
+    return {'content': ''.join(parts), 'finish_reason': finish_reason, 'usage': usage_dict}
+
+
+def run_batch_chat_completions(system_prompt: str,
+                               user_contents: List[str],
+                               deployment_name: Optional[str] = None,
+                               temperature: float = 0.2,
+                               max_output_tokens: int = 2048,
+                               poll_interval_secs: float = 30.0,
+                               timeout_secs: float = 86400.0) -> List[Optional[dict]]:
+    """Run one chat completion per user content through the Batch API and wait for the results.
+
+    Returns a list aligned with user_contents holding the same dict shape as
+    call_chat_completion_with_meta, or None for requests the batch did not complete.
+    Raises if the batch itself fails, expires, or is not done within timeout_secs.
+    """
+    client = get_client()
+    deployment = deployment_name or os.getenv('AZURE_OPENAI_DEPLOYMENT')
+    if not deployment:
+        raise RuntimeError('Missing deployment name. Set AZURE_OPENAI_DEPLOYMENT env var.')
+    lines = [
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {
+                "model": deployment,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": content},
+                ],
+                "temperature": temperature,
+                "max_tokens": max_output_tokens,
+            },
+        })
+        for i, content in enumerate(user_contents)
+    ]
+    input_file = client.files.create(file=('chunks.jsonl', '\n'.join(lines).encode('utf-8')), purpose='batch')
+    batch = None
+    try:
+        batch = client.batches.create(input_file_id=input_file.id, endpoint='/chat/completions', completion_window='24h')
+        deadline = time.monotonic() + timeout_secs
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            if time.monotonic() > deadline:
+                try:
+                    client.batches.cancel(batch.id)
+                except Exception as e:
+                    # Keep the timeout as the reported failure; the batch expires on its own
+                    logger.warning(f"Cancelling batch {batch.id} after timeout failed: {e}")
+                raise TimeoutError(f'Batch {batch.id} not finished after {timeout_secs:.0f}s')
+            time.sleep(poll_interval_secs)
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != 'completed' or not batch.output_file_id:
+            raise RuntimeError(f'Batch {batch.id} ended with status {batch.status}')
+
+        results: List[Optional[dict]] = [None] * len(user_contents)
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get('response') or {}
+            body = response.get('body') or {}
+            choices = body.get('choices') or []
+            if response.get('status_code') != 200 or not choices:
+                continue
+            usage = body.get('usage') or {}
+            results[int(item['custom_id'])] = {
+                'content': (choices[0].get('message') or {}).get('content') or "",
+                'finish_reason': choices[0].get('finish_reason'),
+                'usage': {k: usage[k] for k in USAGE_FIELDS if k in usage},
+            }
+        return results
+    finally:
+        # The files hold the full user text and model output; never leave them in the files store
+        file_ids = [input_file.id]
+        if batch is not None:
+            file_ids += [f for f in (getattr(batch, 'output_file_id', None), getattr(batch, 'error_file_id', None)) if f]
+        for file_id in file_ids:
+            try:
+                client.files.delete(file_id)
+            except Exception:
+                pass  # best effort: a failed delete must not mask the batch result or error
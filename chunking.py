@@ -1,36 +1,119 @@
-from typing import List
+import os
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
 
 try:
     import tiktoken
 except Exception:
     tiktoken = None
 
+_BATCH_THREADS = os.cpu_count() or 4
 
-def _fallback_token_estimate(text: str) -> int:
-    # Rough estimate: assume ~3.5 chars per token for English-ish text
-    return max(1, len(text) // 4)
+# Without tiktoken a token is estimated as ~4 characters; the count is inlined as
+# max(1, len(text) >> _CHARS_PER_TOKEN_SHIFT) on the hot paths below
+_CHARS_PER_TOKEN_SHIFT = 2
 
 
-def _encode_len(text: str, encoding_name: str) -> int:
+@lru_cache(maxsize=8)
+def get_encoding(encoding_name: str = 'o200k_base') -> Optional[Any]:
+    """Return a cached tiktoken Encoding (None if tiktoken is unavailable).
+
+    Loading the BPE ranks is expensive, so each encoding is resolved once per process.
+    Unknown names fall back to o200k_base; if that cannot be loaded either (e.g. offline
+    with no cached vocab) the chunker uses the character-based estimate instead.
+    """
     if tiktoken is None:
-        return _fallback_token_estimate(text)
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        pass
     try:
-        enc = tiktoken.get_encoding(encoding_name)
+        return tiktoken.get_encoding('o200k_base')
     except Exception:
-        enc = tiktoken.get_encoding('o200k_base')
-    return len(enc.encode(text))
+        return None
+
+
+def _encode_len(text: str, enc: Optional[Any]) -> int:
+    if enc is None:
+        return max(1, len(text) >> _CHARS_PER_TOKEN_SHIFT)
+    return len(enc.encode_ordinary(text))
+
+
+def _encode_many(texts: List[str], enc: Optional[Any]) -> Tuple[List[int], Optional[List[List[int]]]]:
+    """Token counts for many texts at once, plus their token lists when an encoding is available.
+
+    tiktoken tokenizes the batch in parallel with the GIL released; the token lists are kept
+    so oversized pieces can be cut in token space without being encoded again.
+    """
+    if enc is None:
+        return [max(1, len(t) >> _CHARS_PER_TOKEN_SHIFT) for t in texts], None
+    token_lists = enc.encode_ordinary_batch(texts, num_threads=_BATCH_THREADS)
+    return [len(tokens) for tokens in token_lists], token_lists
+
 
+def _split_by_tokens(text: str, tokens: List[int], max_tokens: int, enc: Any) -> List[Tuple[str, int]]:
+    """Cut text into pieces of at most max_tokens tokens, returning (piece, token_count) pairs.
 
-def chunk_text_by_tokens(text: str, max_tokens: int = 12000, encoding_name: str = 'o200k_base') -> List[str]:
+    `tokens` is the text's encode_ordinary output; pieces are sliced from it in token space. A multi-byte character can span
+    two tokens, so a cut that would land inside one is moved back a whole token at a time
+    until it falls on a character boundary (the dropped tokens start the next piece).
+    """
+    data = text.encode('utf-8')
+    pieces: List[Tuple[str, int]] = []
+    pos = offset = 0
+    while pos < len(tokens):
+        end = min(len(tokens), pos + max_tokens)
+        length = len(enc.decode_bytes(tokens[pos:end]))
+        while end - 1 > pos and offset + length < len(data) and (data[offset + length] & 0xC0) == 0x80:
+            end -= 1
+            length -= len(enc.decode_single_token_bytes(tokens[end]))
+        while offset + length < len(data) and (data[offset + length] & 0xC0) == 0x80:
+            # A single character wider than the whole budget: keep it in one piece
+            length += len(enc.decode_single_token_bytes(tokens[end]))
+            end += 1
+        pieces.append((data[offset:offset + length].decode('utf-8'), end - pos))
+        pos, offset = end, offset + length
+    return pieces
+
+
+def _split_by_estimate(text: str, max_tokens: int) -> List[Tuple[str, int]]:
+    """Cut text into pieces within max_tokens by the character estimate (no encoding available).
+
+    The estimate is max(1, chars >> _CHARS_PER_TOKEN_SHIFT), so the longest prefix that fits is
+    ((max_tokens + 1) << _CHARS_PER_TOKEN_SHIFT) - 1 characters (one character if nothing fits).
+    """
+    span = ((max_tokens + 1) << _CHARS_PER_TOKEN_SHIFT) - 1 if max_tokens > 0 else 1
+    pieces: List[Tuple[str, int]] = []
+    for start in range(0, len(text), span):
+        piece = text[start:start + span]
+        pieces.append((piece, max(1, len(piece) >> _CHARS_PER_TOKEN_SHIFT)))
+    return pieces
+
+
+def _rejoin(pieces: List[Tuple[str, str]]) -> str:
+    """Join (separator, piece) pairs, dropping the separator before the first piece."""
+    return pieces[0][1] + "".join(sep + piece for sep, piece in pieces[1:])
+
+
+def chunk_text_by_tokens(text: str, max_tokens: int = 12000, encoding_name: str = 'o200k_base',
+                         encoding: Optional[Any] = None) -> List[str]:
     """
     Split large text into chunks that fit within max_tokens.
     Prefer splitting on double newlines, then sentences/lines, then hard split.
+
+    Pass a pre-built `encoding` (see get_encoding) to skip the per-call lookup by name.
     """
     if not text:
         return []
+    # BPE tokens are at least one UTF-8 byte each, so text with no more bytes than the budget
+    # always fits; short inputs skip tokenization entirely (isascii() is O(1) in CPython).
+    if len(text) <= max_tokens and (text.isascii() or len(text.encode('utf-8')) <= max_tokens):
+        return [text]
+    enc = encoding if encoding is not None else get_encoding(encoding_name)
 
     # Fast path, but allow forced splitting for very small max_tokens to support circuit breaker tests
-    est_tokens = _encode_len(text, encoding_name)
+    est_tokens = _encode_len(text, enc)
     if est_tokens <= max_tokens:
         # Aggressive forced splitting for tiny test budgets
         if max_tokens < 10 and len(text) > max_tokens * 2:
@@ -49,51 +132,49 @@ def chunk_text_by_tokens(text: str, max_tokens: int = 12000, encoding_name: str
     chunks: List[str] = []
 
     paragraphs = text.split("\n\n")
-    current = []
+    # Pending pieces with the separator that preceded each one in the input ("\n\n" before a
+    # paragraph, "\n" before a line, "" between hard-split pieces of one line), so a flushed
+    # chunk is rejoined exactly as it appeared
+    current: List[Tuple[str, str]] = []
     current_len = 0
 
-    for para in paragraphs:
-        para_len = _encode_len(para, encoding_name)
+    para_lens, para_tokens = _encode_many(paragraphs, enc)
+    for para_index, (para, para_len) in enumerate(zip(paragraphs, para_lens)):
         if para_len > max_tokens:
-            # Split paragraph into lines
+            # Split paragraph into lines (a single-line paragraph reuses its tokens)
             lines = para.split("\n")
-            for line in lines:
-                line_len = _encode_len(line, encoding_name)
+            if para_tokens is not None and len(lines) == 1:
+                line_lens, line_tokens = [para_len], [para_tokens[para_index]]
+            else:
+                line_lens, line_tokens = _encode_many(lines, enc)
+            for line_index, (line, line_len) in enumerate(zip(lines, line_lens)):
+                line_sep = "\n\n" if line_index == 0 else "\n"
                 if line_len > max_tokens:
                     # Hard split line
-                    start = 0
-                    while start < len(line):
-                        # binary search for cut size? keep it simple
-                        step = max(1000, len(line) // 4)
-                        end = min(len(line), start + step)
-                        piece = line[start:end]
-                        while _encode_len(piece, encoding_name) > max_tokens and end > start:
-                            end -= max(50, step // 4)
-                            piece = line[start:end]
-                        if not piece:
-                            break
-                        if current_len + _encode_len(piece, encoding_name) > max_tokens and current:
-                            chunks.append("\n".join(current))
+                    if line_tokens is not None:
+                        pieces = _split_by_tokens(line, line_tokens[line_index], max_tokens, enc)
+                    else:
+                        pieces = _split_by_estimate(line, max_tokens)
+                    for piece_index, (piece, piece_len) in enumerate(pieces):
+                        if current_len + piece_len > max_tokens and current:
+                            chunks.append(_rejoin(current))
                             current, current_len = [], 0
-                        current.append(piece)
-                        current_len += _encode_len(piece, encoding_name)
-                        start = end
+                        current.append((line_sep if piece_index == 0 else "", piece))
+                        current_len += piece_len
                 else:
                     if current_len + line_len > max_tokens and current:
-                        chunks.append("\n".join(current))
+                        chunks.append(_rejoin(current))
                         current, current_len = [], 0
-                    current.append(line)
+                    current.append((line_sep, line))
                     current_len += line_len
         else:
             if current_len + para_len > max_tokens and current:
-                chunks.append("\n\n".join(current))
+                chunks.append(_rejoin(current))
                 current, current_len = [], 0
-            current.append(para)
+            current.append(("\n\n", para))
             current_len += para_len
 
     if current:
-        # finalize
-        sep = "\n\n" if "\n\n".join(current) in text else "\n"
-        chunks.append(sep.join(current))
+        chunks.append(_rejoin(current))
 
     return chunks
@@ -1,4 +1,6 @@
-from typing import Dict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping
 
 
 _translations: Dict[str, Dict[str, str]] = {
@@ -78,9 +80,14 @@ _translations: Dict[str, Dict[str, str]] = {
     },
 }
 
+# Language codes with a translation table (e.g. for validating the UI-language switcher)
+SUPPORTED_LANGS = frozenset(_translations)
 
-def get_strings(lang: str) -> Dict[str, str]:
+
+@lru_cache(maxsize=8)
+def get_strings(lang: str) -> Mapping[str, str]:
+    # The cached table is shared by every request, so hand out a read-only view of it
     lang = (lang or 'en').lower()
     if lang not in _translations:
         lang = 'en'
-    return _translations[lang]
+    return MappingProxyType(_translations[lang])
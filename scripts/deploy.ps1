@@ -100,7 +100,9 @@ if (-not $GoogleClientSecret -or $GoogleClientSecret.Trim().Length -eq 0) {
 }
 
 Write-Host "Configuring startup command..."
-az webapp config set -g $ResourceGroup -n $AppName --startup-file 'gunicorn --bind=0.0.0.0:$PORT app:app' --output none
+# One worker process: async jobs live in its memory, so status/stream requests must reach the same
+# process. gthread workers still serve concurrent requests while model calls are in flight.
+az webapp config set -g $ResourceGroup -n $AppName --startup-file 'gunicorn --bind=0.0.0.0:$PORT --worker-class gthread --workers 1 --threads 8 app:app' --output none
 
 Write-Host "Creating deployment zip..."
 # Always package from repository root (parent of scripts folder) so templates/ and static/ are included
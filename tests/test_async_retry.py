@@ -43,9 +43,9 @@ def test_async_job_retry_and_success(client, monkeypatch):
     # Plan: first chunk errors 429 twice then succeeds
     global responses_plan
     responses_plan = ['error:429', 'error:429', 'ok']
-    monkeypatch.setenv('RETRY_MAX_ATTEMPTS', '4')
-    monkeypatch.setenv('MAX_PARALLEL_REQUESTS', '1')
-    monkeypatch.setenv('MAX_INPUT_TOKENS', '10')  # force single chunk
+    monkeypatch.setitem(flask_app.config, 'RETRY_MAX_ATTEMPTS', 4)
+    monkeypatch.setitem(flask_app.config, 'MAX_PARALLEL_REQUESTS', 1)
+    monkeypatch.setitem(flask_app.config, 'MAX_INPUT_TOKENS', 10)  # force single chunk
 
     rv = client.post('/process', data={'text': 'Hello world', 'mode':'grammar'})
     assert rv.status_code == 200
@@ -76,10 +76,10 @@ def test_async_job_circuit_breaker(client, monkeypatch):
     global responses_plan
     # Force consecutive failures beyond threshold
     responses_plan = ['error:500', 'error:500', 'error:500']
-    monkeypatch.setenv('RETRY_MAX_ATTEMPTS', '1')  # no internal retry per chunk
-    monkeypatch.setenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '2')
-    monkeypatch.setenv('MAX_PARALLEL_REQUESTS', '2')
-    monkeypatch.setenv('MAX_INPUT_TOKENS', '4')  # create multiple chunks
+    monkeypatch.setitem(flask_app.config, 'RETRY_MAX_ATTEMPTS', 1)  # no internal retry per chunk
+    monkeypatch.setitem(flask_app.config, 'CIRCUIT_BREAKER_FAILURE_THRESHOLD', 2)
+    monkeypatch.setitem(flask_app.config, 'MAX_PARALLEL_REQUESTS', 2)
+    monkeypatch.setitem(flask_app.config, 'MAX_INPUT_TOKENS', 4)  # create multiple chunks
 
     rv = client.post('/process', data={'text': 'abcdefghi', 'mode':'grammar'})
     assert rv.status_code == 200
@@ -100,3 +100,148 @@ def test_async_job_circuit_breaker(client, monkeypatch):
 
     assert data['status'] == 'failed'
     assert data['chunks_failed'] >= 1
+
+
+def test_async_job_unexpected_exception_marks_failed(client, monkeypatch):
+    # An error escaping the job body must still finish the job (so it is evictable and streams end)
+    import app as app_module
+    from importlib import import_module
+    mod = import_module('azure_openai_client')
+
+    def failing_batch(**kwargs):
+        raise RuntimeError('batch unavailable')
+
+    real_log_json = app_module._log_json
+
+    def exploding_log_json(event, **fields):
+        if event == 'batch_failed':
+            raise RuntimeError('unexpected')
+        real_log_json(event, **fields)
+
+    monkeypatch.setattr(mod, 'run_batch_chat_completions', failing_batch)
+    monkeypatch.setattr(app_module, '_log_json', exploding_log_json)
+    monkeypatch.setitem(flask_app.config, 'AOAI_BATCH_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'AOAI_BATCH_MIN_CHUNKS', 1)
+
+    rv = client.post('/process', data={'text': 'Hello world', 'mode':'grammar'})
+    assert rv.status_code == 200
+    import re
+    m = re.search(r'data-job-id="([A-Za-z0-9_-]+)"', rv.data.decode('utf-8'))
+    assert m, 'job id not found in html'
+    job_id = m.group(1)
+
+    for _ in range(30):
+        data = client.get(f'/job/{job_id}/status').get_json()
+        if data['status'] in ('succeeded','failed'):
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail('Job stayed running after an unexpected exception')
+
+    assert data['status'] == 'failed'
+    assert 'unexpected' in data['error']
+
+
+def _wait_for_job(client, job_id, attempts=40):
+    for _ in range(attempts):
+        data = client.get(f'/job/{job_id}/status').get_json()
+        if data['status'] in ('succeeded','failed'):
+            return data
+        time.sleep(0.2)
+    pytest.fail('Job did not finish in time')
+
+
+def test_async_job_counts_only_consumed_chunks(client, monkeypatch):
+    # Chunk 0 fails for good while the prefetched chunks behind it succeed; the job must not
+    # report those never-emitted chunks as completed
+    from importlib import import_module
+    mod = import_module('azure_openai_client')
+
+    def content_based_call(system_prompt, user_content, deployment_name, temperature, max_output_tokens):
+        if 'X' in user_content:
+            raise SimulatedError(400, 'bad request')
+        return f"RESULT-{user_content}"
+
+    monkeypatch.setattr(mod, 'call_chat_completion', content_based_call)
+    monkeypatch.setitem(flask_app.config, 'RETRY_MAX_ATTEMPTS', 1)
+    monkeypatch.setitem(flask_app.config, 'MAX_PARALLEL_REQUESTS', 4)
+    monkeypatch.setitem(flask_app.config, 'MAX_INPUT_TOKENS', 4)
+
+    rv = client.post('/process', data={'text': 'XXXXXXXX' + 'abcdefgh' * 3, 'mode':'grammar'})
+    assert rv.status_code == 200
+    import re
+    m = re.search(r'data-job-id="([A-Za-z0-9_-]+)"', rv.data.decode('utf-8'))
+    assert m, 'job id not found in html'
+    data = _wait_for_job(client, m.group(1))
+
+    assert data['status'] == 'failed'
+    assert data['chunks_completed'] == 0
+    assert data['progress_percent'] == 0.0
+
+
+def test_async_job_abort_stops_inflight_retries(client, monkeypatch):
+    # Chunk 0 fails for good; chunk 1 is throttled and backing off when the job aborts, so it
+    # must stop retrying instead of calling the model again after the job is finalised
+    from importlib import import_module
+    mod = import_module('azure_openai_client')
+    calls = {'X': 0, 'Y': 0}
+
+    def content_based_call(system_prompt, user_content, deployment_name, temperature, max_output_tokens):
+        key = 'X' if 'X' in user_content else 'Y'
+        calls[key] += 1
+        if key == 'X':
+            time.sleep(0.1)  # let chunk 1 enter its backoff first
+            raise SimulatedError(400, 'bad request')
+        raise SimulatedError(429, 'throttled')
+
+    monkeypatch.setattr(mod, 'call_chat_completion', content_based_call)
+    monkeypatch.setitem(flask_app.config, 'RETRY_MAX_ATTEMPTS', 4)
+    monkeypatch.setitem(flask_app.config, 'RETRY_BASE_DELAY_SECS', 0.3)
+    monkeypatch.setitem(flask_app.config, 'RETRY_JITTER_SECS', 0)
+    monkeypatch.setitem(flask_app.config, 'MAX_PARALLEL_REQUESTS', 2)
+    monkeypatch.setitem(flask_app.config, 'MAX_INPUT_TOKENS', 4)
+
+    rv = client.post('/process', data={'text': 'XXXXXXXX' + 'YYYYYYYY', 'mode':'grammar'})
+    assert rv.status_code == 200
+    import re
+    m = re.search(r'data-job-id="([A-Za-z0-9_-]+)"', rv.data.decode('utf-8'))
+    assert m, 'job id not found in html'
+    data = _wait_for_job(client, m.group(1))
+    time.sleep(1.5)  # longer than chunk 1's remaining backoff schedule
+
+    assert data['status'] == 'failed'
+    assert calls['Y'] == 1
+    assert client.get(f'/job/{m.group(1)}/status').get_json()['chunks_retried'] == 0
+
+
+def test_concurrent_jobs_share_the_chunk_pool(client, monkeypatch):
+    # A large job must not occupy every pool worker: a second job's chunk calls start while
+    # the first job's calls are still in flight
+    from importlib import import_module
+    mod = import_module('azure_openai_client')
+    starts = {'A': [], 'B': []}
+    call_secs = 0.5
+
+    def slow_call(system_prompt, user_content, deployment_name, temperature, max_output_tokens):
+        starts['A' if 'A' in user_content else 'B'].append(time.monotonic())
+        time.sleep(call_secs)
+        return f"RESULT-{user_content}"
+
+    monkeypatch.setattr(mod, 'call_chat_completion', slow_call)
+    monkeypatch.setitem(flask_app.config, 'MAX_PARALLEL_REQUESTS', flask_app.config['CHUNK_POOL_SIZE'])
+    monkeypatch.setitem(flask_app.config, 'MAX_INPUT_TOKENS', 4)
+
+    import re
+    job_ids = []
+    rv = client.post('/process', data={'text': 'AAAAAAAA' * 12, 'mode':'grammar'})
+    job_ids.append(re.search(r'data-job-id="([A-Za-z0-9_-]+)"', rv.data.decode('utf-8')).group(1))
+    for _ in range(50):
+        if starts['A']:
+            break
+        time.sleep(0.02)
+    rv = client.post('/process', data={'text': 'BBBBBBBB' * 2, 'mode':'grammar'})
+    job_ids.append(re.search(r'data-job-id="([A-Za-z0-9_-]+)"', rv.data.decode('utf-8')).group(1))
+
+    for job_id in job_ids:
+        assert _wait_for_job(client, job_id, attempts=60)['status'] == 'succeeded'
+    assert starts['B'] and min(starts['B']) - min(starts['A']) < call_secs
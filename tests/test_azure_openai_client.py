@@ -0,0 +1,74 @@
+import json
+import types
+
+import pytest
+from openai import AzureOpenAI
+
+import azure_openai_client
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    # Stub token provider so no credential is needed; start without a cached client
+    monkeypatch.setenv('AZURE_OPENAI_ENDPOINT', 'https://example.openai.azure.com/')
+    monkeypatch.setattr(azure_openai_client, '_token_provider', lambda: 'test-token')
+    monkeypatch.setattr(azure_openai_client, '_client', None)
+    yield
+
+
+def test_get_client_builds_azure_openai_client(fresh_client):
+    client = azure_openai_client.get_client()
+    assert isinstance(client, AzureOpenAI)
+    # Built once, then reused
+    assert azure_openai_client.get_client() is client
+
+
+def test_get_client_requires_endpoint(fresh_client, monkeypatch):
+    monkeypatch.delenv('AZURE_OPENAI_ENDPOINT')
+    with pytest.raises(RuntimeError):
+        azure_openai_client.get_client()
+
+
+class _FakeBatchClient:
+    """Minimal files/batches surface for run_batch_chat_completions."""
+
+    def __init__(self, status):
+        self.deleted = []
+        batch = types.SimpleNamespace(id='batch-1', status=status, output_file_id='out-1', error_file_id='err-1')
+        output = json.dumps({'custom_id': '0', 'response': {'status_code': 200, 'body': {
+            'choices': [{'message': {'content': 'done'}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 3, 'completion_tokens': 1, 'total_tokens': 4}}}})
+        self.files = types.SimpleNamespace(
+            create=lambda **kw: types.SimpleNamespace(id='in-1'),
+            content=lambda file_id: types.SimpleNamespace(text=output),
+            delete=self.deleted.append,
+        )
+        self.batches = types.SimpleNamespace(create=lambda **kw: batch, retrieve=lambda batch_id: batch)
+
+
+@pytest.mark.parametrize('status', ['completed', 'failed'])
+def test_batch_files_deleted(monkeypatch, status):
+    fake = _FakeBatchClient(status)
+    monkeypatch.setattr(azure_openai_client, 'get_client', lambda: fake)
+    if status == 'completed':
+        results = azure_openai_client.run_batch_chat_completions('sys', ['hello'], deployment_name='d')
+        assert results[0]['content'] == 'done'
+        assert results[0]['usage']['total_tokens'] == 4
+    else:
+        with pytest.raises(RuntimeError):
+            azure_openai_client.run_batch_chat_completions('sys', ['hello'], deployment_name='d')
+    assert sorted(fake.deleted) == ['err-1', 'in-1', 'out-1']
+
+
+def test_batch_timeout_survives_failed_cancel(monkeypatch):
+    fake = _FakeBatchClient('in_progress')
+
+    def failing_cancel(batch_id):
+        raise ConnectionError('network down')
+
+    fake.batches.cancel = failing_cancel
+    monkeypatch.setattr(azure_openai_client, 'get_client', lambda: fake)
+    with pytest.raises(TimeoutError):
+        azure_openai_client.run_batch_chat_completions('sys', ['hello'], deployment_name='d',
+                                                       poll_interval_secs=0, timeout_secs=-1)
+    assert 'in-1' in fake.deleted
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from chunking import chunk_text_by_tokens, _split_by_estimate, _split_by_tokens
+
+tiktoken = pytest.importorskip('tiktoken')
+
+
+def _make_encoding():
+    """Small offline BPE vocab whose merges straddle UTF-8 character boundaries."""
+    ranks = {bytes([b]): b for b in range(256)}
+    for merged in (b'a\xc3', b'x\xe2', b'x\xe2\x82', b'\x82\xac', b'ab', b'ab ', b' a'):
+        ranks[merged] = len(ranks)
+    return tiktoken.Encoding(name='test_bpe', pat_str=r' ?\S+|\s+', mergeable_ranks=ranks, special_tokens={})
+
+
+ENC = _make_encoding()
+ALPHABET = ['a', 'b', 'ab', ' ', 'é', 'x', '€', '。', 'Ü', '\n', '\n\n', 'aé', 'x€'] + ['abab'] * 3
+
+
+def _random_texts(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 120)))
+
+
+def _non_ws(s):
+    return ''.join(s.split())
+
+
+@pytest.mark.parametrize('encoding', [ENC, None], ids=['bpe', 'estimate'])
+@pytest.mark.parametrize('max_tokens', [12, 25, 60])
+def test_chunks_are_spans_and_keep_content(encoding, max_tokens, monkeypatch):
+    if encoding is None:
+        # encoding=None would otherwise look up a real tiktoken encoding by name
+        monkeypatch.setattr('chunking.get_encoding', lambda name='o200k_base': None)
+    for text in _random_texts(300, seed=max_tokens):
+        chunks = chunk_text_by_tokens(text, max_tokens=max_tokens, encoding=encoding)
+        assert all(ch in text for ch in chunks)
+        assert _non_ws(''.join(chunks)) == _non_ws(text)
+
+
+@pytest.mark.parametrize('max_tokens', [3, 7, 20])
+def test_split_by_tokens_within_budget(max_tokens):
+    for text in _random_texts(300, seed=max_tokens):
+        line = text.replace('\n', '')
+        if not line:
+            continue
+        pieces = _split_by_tokens(line, ENC.encode_ordinary(line), max_tokens, ENC)
+        assert ''.join(piece for piece, _ in pieces) == line
+        assert all(count <= max_tokens for _, count in pieces)
+
+
+@pytest.mark.parametrize('max_tokens', [1, 5, 20])
+def test_split_by_estimate_within_budget(max_tokens):
+    for text in _random_texts(300, seed=max_tokens):
+        pieces = _split_by_estimate(text, max_tokens)
+        assert ''.join(piece for piece, _ in pieces) == text
+        assert all(count <= max_tokens for _, count in pieces)
@@ -25,3 +25,22 @@ def test_sanitize_no_change_on_plain():
 
 def test_empty_input():
     assert sanitize_model_output("") == ""
+
+
+@pytest.mark.parametrize(
+    'raw,expected', [
+        # A fence is only unwrapped when it encloses the whole output; trailing prose keeps it
+        ("```\nHallo Welt\n```\nThe text was already correct.", "```\nHallo Welt\n```\nThe text was already correct."),
+        ("```text\nHello\n```", "Hello"),
+        # Stacked lead phrase and label are both removed
+        ("Here is the translation:\nTranslation:\nBonjour le monde", "Bonjour le monde"),
+        # A lone label is kept rather than emptying the output
+        ("Translation:", "Translation:"),
+        ("Corrected text:\n", "Corrected text:"),
+        # Blank lines after a label are dropped, the first line's indentation is kept
+        ("Translation:\n\n\n    indented line\nnext", "    indented line\nnext"),
+        ("\n\n\n    indented code\nnext line", "indented code\nnext line"),
+    ]
+)
+def test_sanitize_exact(raw, expected):
+    assert sanitize_model_output(raw) == expected
@@ -0,0 +1,28 @@
+import pytest
+from app import app as flask_app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    flask_app.config['TESTING'] = True
+    monkeypatch.setitem(flask_app.config, 'DISABLE_AUTH', True)
+    with flask_app.test_client() as c:
+        yield c
+
+
+def test_index_view_does_not_set_session_cookie(client):
+    # Anonymous history ids are only created when history is written, not on a page view
+    rv = client.get('/')
+    assert rv.status_code == 200
+    assert 'Set-Cookie' not in rv.headers
+
+
+def test_index_renders_history():
+    from flask import render_template
+    from i18n import get_strings
+    entry = {'timestamp': '2026-01-01T00:00:00Z', 'mode': 'translate', 'target_lang': 'German', 'input_preview': 'Hello world'}
+    with flask_app.test_request_context('/'):
+        html = render_template('index.html', user=None, result=None, source_lang=None, target_lang=None,
+                               mode='grammar', history=[entry], strings=get_strings('en'), ui_lang='en')
+    assert 'Session History' in html
+    assert 'translate → German: Hello world' in html